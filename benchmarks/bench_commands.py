@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Benchmarks Osintgram commands against a synthetic account.
+
+The Instagram client is replaced by SyntheticClient, which generates posts,
+comments, followers and feed pages on the fly (paginated with next_max_id like
+the real endpoints) and counts the calls made to it. Requests are not rate
+limited and photos are not downloaded, so the numbers measure the command
+loops themselves. With --mock-cdn photos are downloaded for real from a local
+src.mockcdn server instead.
+
+    python benchmarks/bench_commands.py --size medium
+    python benchmarks/bench_commands.py --posts 5000 --comments 200 --followers 1000000 followers wcommented
+
+For every command it reports wall time, peak traced memory and the API calls made.
+By default every registered command runs except cache and target; prompts take
+their default answers, as in batch mode.
+"""
+import argparse
+import collections
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.Osintgram import Osintgram
+from src.downloader import Downloader
+from src.geocoder import Geocoder
+from src.session import SharedClient
+from src import config
+from src import mockcdn
+from src import registry
+
+
+SIZES = {
+    'small': {'posts': 100, 'comments': 10, 'followers': 1000},
+    'medium': {'posts': 1000, 'comments': 100, 'followers': 100000},
+    'large': {'posts': 5000, 'comments': 200, 'followers': 1000000},
+}
+
+# Commands left out of the default run: cache wipes config/settings.json, target needs a username
+SKIPPED = ('cache', 'target')
+
+USERS_PAGE = 200
+COMMENTS_PAGE = 20
+FEED_PAGE = 18
+STORIES = 10
+
+
+class SyntheticClient:
+    """
+    Fake instagrapi client serving a generated account. Pages are built on
+    request, so even a million followers never sit in memory at once.
+    """
+
+    thread_safe = True
+    user_id = "1"
+    username = "benchmark"
+
+    def __init__(self, posts, comments, followers):
+        self.posts = posts
+        self.comments = comments
+        self.followers = followers
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def __count__(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def user(self, n):
+        return {'pk': str(1000 + n), 'username': "user%i" % n, 'full_name': "User %i" % n}
+
+    def post(self, n):
+        return {
+            'id': "%i_42" % n,
+            'pk': str(n),
+            'media_type': 1,
+            'taken_at': 1700000000 - n * 3600,
+            'caption': {'text': "post %i #tag%i #bench" % (n, n % 10)},
+            'caption_text': "post %i #tag%i #bench" % (n, n % 10),
+            'accessibility_caption': "Photo %i of the benchmark account" % n,
+            'comment_count': self.comments,
+            'like_count': n,
+            'location': {'lat': 45.0 + (n % 7) / 10, 'lng': 9.0 + (n % 5) / 10},
+            'usertags': {'in': [{'user': self.user(n % 50)}]},
+            'image_versions2': {'candidates': [{'url': "http://localhost/%i.jpg" % n}]},
+        }
+
+    def generate_uuid(self):
+        self.__count__('generate_uuid')
+        return "00000000-0000-0000-0000-000000000000"
+
+    def user_info_by_username(self, username):
+        self.__count__('user_info_by_username')
+        return SimpleNamespace(pk="42", username=username, full_name="Target", is_private=False,
+                               media_count=self.posts, follower_count=self.followers, following_count=self.followers,
+                               biography="", profile_pic_url="http://localhost/propic.jpg",
+                               profile_pic_url_hd="http://localhost/propic.jpg")
+
+    def user_friendship_v1(self, user_id):
+        self.__count__('user_friendship_v1')
+        return SimpleNamespace(following=True)
+
+    def user_medias_paginated(self, user_id, amount, end_cursor=""):
+        self.__count__('user_medias_paginated')
+        start = int(end_cursor or 0)
+        end = min(self.posts, start + amount)
+        return [self.post(n) for n in range(start, end)], (str(end) if end < self.posts else "")
+
+    def user_feed(self, user_id, max_id=None):
+        self.__count__('user_feed')
+        start = int(max_id or 0)
+        end = min(self.posts, start + FEED_PAGE)
+        return {'items': [self.post(n) for n in range(start, end)],
+                'next_max_id': str(end) if end < self.posts else None}
+
+    def media_comments(self, media_id, max_id=None):
+        self.__count__('media_comments')
+        start = int(max_id or 0)
+        end = min(self.comments, start + COMMENTS_PAGE)
+        return {'comments': [{'pk': "%s_%i" % (media_id, n), 'user_id': self.user(n)['pk'], 'user': self.user(n),
+                              'text': "comment %i" % n} for n in range(start, end)],
+                'next_max_id': str(end) if end < self.comments else None}
+
+    def user_info(self, user_id):
+        self.__count__('user_info')
+        n = int(user_id) - 1000
+        user = dict(self.user(n))
+        if n % 3 == 0:
+            user['public_email'] = "user%i@example.com" % n
+            user['contact_phone_number'] = "+1555%07i" % n
+        return {'user': user}
+
+    def usertag_feed(self, user_id, max_id=None):
+        self.__count__('usertag_feed')
+        start = int(max_id or 0)
+        end = min(self.posts, start + FEED_PAGE)
+        return {'items': [dict(self.post(n), user=self.user(n % 50)) for n in range(start, end)],
+                'next_max_id': str(end) if end < self.posts else None}
+
+    def user_reel_media(self, user_id):
+        self.__count__('user_reel_media')
+        items = []
+        for n in range(min(self.posts, STORIES)):
+            story = {'id': "story%i" % n, 'media_type': 1 + n % 2,
+                     'image_versions2': {'candidates': [{'url': "http://localhost/story%i.jpg" % n}]}}
+            if story['media_type'] == 2:
+                story['video_versions'] = [{'url': "http://localhost/story%i.mp4" % n}]
+            items.append(story)
+        return {'items': items}
+
+    def user_followers(self, user_id, rank_token=None, max_id=None):
+        self.__count__('user_followers')
+        return self.__users__(max_id)
+
+    def user_following(self, user_id, rank_token=None, max_id=None):
+        self.__count__('user_following')
+        return self.__users__(max_id)
+
+    def __users__(self, max_id):
+        start = int(max_id or 0)
+        end = min(self.followers, start + USERS_PAGE)
+        return {'users': [self.user(n) for n in range(start, end)],
+                'next_max_id': str(end) if end < self.followers else None}
+
+
+class SyntheticBackend:
+    # Geocoder backend naming every point after its coordinates, without a network lookup
+    name = "synthetic"
+    remote = False
+
+    def reverse(self, lat, lng):
+        return "Place %.4f, %.4f" % (lat, lng)
+
+
+class CountingDownloader:
+    # Accepts downloads without fetching anything, so photos measures the feed loop
+    def __init__(self):
+        self.submitted = 0
+
+    def batch(self):
+        return CountingDownloader()
+
+    def submit(self, url, path, callback=None):
+        self.submitted += 1
+
+    def wait(self):
+        return self.submitted, 0
+
+
+class BenchOsintgram(Osintgram):
+    def __init__(self, client, output_dir, cdn=None):
+        self.client = client
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            super().__init__("target", False, False, True, output_dir, False, use_cache=False,
+                             feed_depth=client.posts, stats=False)
+        if cdn is None:
+            self.downloader = CountingDownloader()
+        else:
+            self.downloader = Downloader(config.getDownloadWorkers(), config.getDownloadRetries(),
+                                         config.getDownloadTimeout(), base_url=cdn.url)
+
+    def build_geolocator(self):
+        return Geocoder(SyntheticBackend())
+
+    def login(self, u, p):
+        self.api = self.client
+        self.session = SharedClient(self.client, config.getApiWorkers())
+
+
+def run(command, client, trace, cdn=None):
+    # A new instance per run, so every command starts with cold session caches
+    with tempfile.TemporaryDirectory() as output_dir:
+        api = BenchOsintgram(client, output_dir, cdn)
+        client.calls.clear()
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if 'profile' in registry.commands[command].needs:
+                # The profile comes with the target lookup done at startup, fetch it
+                # again so that info and propic pay for their input like the others
+                api.target_user = api.get_user(api.target)['user']
+            api.run_command(command)
+        seconds = time.perf_counter() - started
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return seconds, peak, dict(client.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Osintgram commands against a synthetic account')
+    parser.add_argument('commands', nargs='*', help='commands to run (default: all but %s)' % ", ".join(SKIPPED))
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='account size preset')
+    parser.add_argument('--posts', type=int, help='number of posts of the account')
+    parser.add_argument('--comments', type=int, help='number of comments of every post')
+    parser.add_argument('--followers', type=int, help='number of followers (and followings) of the account')
+    parser.add_argument('--no-memory', help='skip the tracemalloc run', action='store_true')
+    parser.add_argument('--mock-cdn', help='download photos from a local mock CDN instead of only counting them',
+                        action='store_true')
+    parser.add_argument('--photo-size', type=int, default=150000, help='bytes of every photo served by the mock CDN')
+    args = parser.parse_args()
+
+    registry.load_plugins(['src.analyzers'] + config.getPlugins())
+
+    size = dict(SIZES[args.size])
+    for key in size:
+        if getattr(args, key) is not None:
+            size[key] = getattr(args, key)
+    client = SyntheticClient(size['posts'], size['comments'], size['followers'])
+    cdn = None
+    if args.mock_cdn:
+        cdn = mockcdn.start(size=args.photo_size)
+
+    print("Account: %(posts)i posts, %(comments)i comments per post, %(followers)i followers" % size)
+    print("%-12s %10s %12s %8s  %s" % ("command", "wall (s)", "peak (MB)", "calls", "calls by endpoint"))
+    commands = args.commands or [name for name in sorted(registry.commands) if name not in SKIPPED]
+    for command in commands:
+        # Wall time is measured without tracemalloc, which slows allocations down
+        seconds, _, calls = run(command, client, False, cdn)
+        peak = None
+        if not args.no_memory:
+            peak = run(command, client, True, cdn)[1]
+        print("%-12s %10.3f %12s %8i  %s" % (
+            command, seconds, "-" if peak is None else "%.1f" % (peak / 1024 / 1024), sum(calls.values()),
+            ", ".join("%s=%i" % item for item in sorted(calls.items()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,26 @@
 import os
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
+import time
+startup_started = time.perf_counter()
 
 from src.Osintgram import Osintgram
 import argparse
+import functools
+import datetime
 from src import printcolors as pc
 from src import artwork
+from src import config
+from src import registry
+from src import jobs
+from src import profiling
 import sys
 import signal
 
-is_windows = False
+imports_time = time.perf_counter() - startup_started
 
-try:
-    import gnureadline  
-except: 
-    is_windows = True
-    import pyreadline
+# Settings read by commands while they run; DEPTH and SINCE are fixed when a command starts
+JOB_SETTINGS = ('FILE', 'JSON', 'SYNC', 'STATS')
 
 
 def printlogo():
@@ -28,6 +33,18 @@ def printlogo():
     pc.printout("Type 'JSON=y' to export results to a JSON files like '<target username>_<command>.json (default is "
                 "disabled)'\n")
     pc.printout("Type 'JSON=n' to disable exporting to files'\n")
+    pc.printout("Type 'SYNC=y' to only download photos and stories missing from the output folder (default is "
+                "disabled)'\n")
+    pc.printout("Type 'SYNC=n' to disable incremental sync'\n")
+    pc.printout("Type 'STATS=n' to stop printing API calls, latencies and bytes after each command (default is "
+                "enabled)\n")
+    pc.printout("Type 'PROFILE=y' to profile commands with cProfile into '<target username>_<command>.prof' "
+                "(default is disabled)\n")
+    pc.printout("Type 'DEPTH=<n>' to analyse the latest <n> posts (default is 100) and 'SINCE=<yyyy-mm-dd>' to only "
+                "analyse posts since a date\n")
+    pc.printout("Add 'depth=<n>' or 'since=<yyyy-mm-dd>' after a command to override them once, e.g. 'addrs "
+                "depth=500'\n")
+    pc.printout("End a command with '&' to run it in the background, e.g. 'followers &', and check it with 'jobs'\n")
 
 
 def cmdlist():
@@ -35,52 +52,27 @@ def cmdlist():
     print("Enable/disable output in a '<target username>_<command>.txt' file'")
     pc.printout("JSON=y/n\t")
     print("Enable/disable export in a '<target username>_<command>.json' file'")
-    pc.printout("addrs\t\t")
-    print("Get all registered addressed by target photos")
-    pc.printout("cache\t\t")
-    print("Clear cache of the tool")
-    pc.printout("captions\t")
-    print("Get target's photos captions")
-    pc.printout("commentdata\t")
-    print("Get a list of all the comments on the target's posts")
-    pc.printout("comments\t")
-    print("Get total comments of target's posts")
-    pc.printout("followers\t")
-    print("Get target followers")
-    pc.printout("followings\t")
-    print("Get users followed by target")
-    pc.printout("fwersemail\t")
-    print("Get email of target followers")
-    pc.printout("fwingsemail\t")
-    print("Get email of users followed by target")
-    pc.printout("fwersnumber\t")
-    print("Get phone number of target followers")
-    pc.printout("fwingsnumber\t")
-    print("Get phone number of users followed by target")    
-    pc.printout("hashtags\t")
-    print("Get hashtags used by target")
-    pc.printout("info\t\t")
-    print("Get target info")
-    pc.printout("likes\t\t")
-    print("Get total likes of target's posts")
-    pc.printout("mediatype\t")
-    print("Get target's posts type (photo or video)")
-    pc.printout("photodes\t")
-    print("Get description of target's photos")
-    pc.printout("photos\t\t")
-    print("Download target's photos in output folder")
-    pc.printout("propic\t\t")
-    print("Download target's profile picture")
-    pc.printout("stories\t\t")
-    print("Download target's stories")
-    pc.printout("tagged\t\t")
-    print("Get list of users tagged by target")
-    pc.printout("target\t\t")
-    print("Set new target")
-    pc.printout("wcommented\t")
-    print("Get a list of user who commented target's photos")
-    pc.printout("wtagged\t\t")
-    print("Get a list of user who tagged target")
+    pc.printout("SYNC=y/n\t")
+    print("Enable/disable incremental sync of photos and stories")
+    pc.printout("PROFILE=y/n\t")
+    print("Enable/disable cProfile, saving '<target username>_<command>.prof' in the output folder")
+    pc.printout("STATS=y/n\t")
+    print("Enable/disable the API calls, latency and bytes summary after each command")
+    pc.printout("DEPTH=<n>\t")
+    print("Analyse the latest <n> posts of the target")
+    pc.printout("SINCE=<date>\t")
+    print("Only analyse posts published since <yyyy-mm-dd> ('SINCE=' to disable)")
+    pc.printout("<command> &\t")
+    print("Run a command in the background, its prompts take their default answer")
+    pc.printout("jobs\t\t")
+    print("List background jobs with their status and progress")
+    pc.printout("wait <id>\t")
+    print("Wait for a background job and show its output")
+    pc.printout("cancel <id>\t")
+    print("Stop a background job at its next request")
+    for name in sorted(registry.commands):
+        pc.printout(name + ("\t\t" if len(name) < 8 else "\t"))
+        print(registry.commands[name].help)
 
 
 def signal_handler(sig, frame):
@@ -95,18 +87,188 @@ def completer(text, state):
     else:
         return None
 
+def parse_feed_options(params):
+    options = {}
+    for param in params:
+        key, _, value = param.partition("=")
+        try:
+            if key == "depth":
+                options['depth'] = api.parse_feed_depth(value)
+            elif key == "since" and value:
+                options['since'] = api.parse_feed_since(value)
+            else:
+                pc.printout("Unknown option " + param + "\n", pc.RED)
+                return None
+        except ValueError:
+            pc.printout("Error! Invalid value for " + key + ": " + value + "\n", pc.RED)
+            return None
+    return options
+
+
+def run(name, params):
+    options = parse_feed_options(params.split())
+    if options is None:
+        return False
+    profiled = name in registry.commands and (profile_cpu or trace_memory)
+    if profiled and jobs.current() is not None:
+        # cProfile and tracemalloc are process wide, only one command at a time can use them
+        pc.printout("Background jobs are not profiled, run the command in the foreground to profile it\n",
+                    pc.YELLOW)
+        profiled = False
+    if not profiled:
+        with api.feed_options(**options):
+            commands[name]()
+        return True
+    base_name = api.output_dir + "/" + api.target + "_" + name
+    with api.feed_options(**options), profiling.profile_command(base_name, profile_cpu, trace_memory,
+                                                                config.getProfileTop()):
+        commands[name]()
+    return True
+
+
+def set_profile(flag):
+    global profile_cpu
+    if flag:
+        pc.printout("Profiling: ")
+        pc.printout("enabled", pc.GREEN)
+        pc.printout("\n")
+    else:
+        pc.printout("Profiling: ")
+        pc.printout("disabled", pc.RED)
+        pc.printout("\n")
+    profile_cpu = flag
+
+
+def execute(cmd, interactive=False):
+    # Returns False when the line could not be run: unknown command, bad option or refused change
+    line = cmd.strip()
+    background = interactive and line.endswith("&")
+    if background:
+        line = line[:-1].strip()
+    name, _, params = line.partition(" ")
+    _cmd = commands.get(name)
+
+    # Running jobs read the target and these settings until they finish
+    setting = "the target" if name == "target" else line.partition("=")[0]
+    if (name == "target" or setting in JOB_SETTINGS) and jobs.running():
+        pc.printout("Can't change " + setting + " while jobs are running, wait for them or cancel them\n", pc.RED)
+        return False
+
+    # 'target' asks for the new username, so it always runs in the foreground
+    if _cmd and background and name in registry.commands and name != "target":
+        job = jobs.start(line, functools.partial(run, name, params), api.output_dir)
+        pc.printout("[" + str(job.id) + "] started " + job.name + "\n", pc.CYAN)
+    elif name == "target" and params.strip():
+        api.change_target(params.strip())
+    elif _cmd:
+        return run(name, params)
+    elif name == "jobs":
+        jobs.print_jobs()
+    elif name == "wait":
+        jobs.wait(params.strip())
+    elif name == "cancel":
+        jobs.cancel(params.strip())
+    elif line == "FILE=y":
+        api.set_write_file(True)
+    elif line == "FILE=n":
+        api.set_write_file(False)
+    elif line == "JSON=y":
+        api.set_json_dump(True)
+    elif line == "JSON=n":
+        api.set_json_dump(False)
+    elif line == "SYNC=y":
+        api.set_sync(True)
+    elif line == "SYNC=n":
+        api.set_sync(False)
+    elif line == "PROFILE=y":
+        set_profile(True)
+    elif line == "PROFILE=n":
+        set_profile(False)
+    elif line == "STATS=y":
+        api.set_stats(True)
+    elif line == "STATS=n":
+        api.set_stats(False)
+    elif line.startswith("DEPTH="):
+        api.set_feed_depth(line[len("DEPTH="):])
+    elif line.startswith("SINCE="):
+        api.set_feed_since(line[len("SINCE="):])
+    elif line == "":
+        print("")
+    else:
+        pc.printout("Unknown command\n", pc.RED)
+        return False
+    return True
+
+
+def read_script(file_name):
+    # One command per line, blank lines and lines starting with '#' are skipped
+    if file_name == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(file_name) as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def print_batch_summary(timings):
+    pc.printout("\nBatch summary\n", pc.CYAN)
+    for cmd, seconds, status in timings:
+        print("%-30s %8.2f s  %s" % (cmd, seconds, status))
+    print("%-30s %8.2f s" % ("total", sum(t[1] for t in timings)))
+
+
+def depth_arg(value):
+    try:
+        depth = int(value)
+    except ValueError:
+        depth = 0
+    if depth <= 0:
+        raise argparse.ArgumentTypeError("feed depth must be a positive number of posts")
+    return depth
+
+
+def date_arg(value):
+    try:
+        datetime.datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError("dates must look like 2025-01-01")
+    return value
+
+
+def latency_arg(value):
+    if value == "recorded":
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("latency must be a number of seconds or 'recorded'")
+
+
+def setup_readline():
+    # Line editing and tab completion are only needed by the interactive shell
+    try:
+        import gnureadline
+        gnureadline.parse_and_bind("tab: complete")
+        gnureadline.set_completer(completer)
+    except ImportError:
+        import pyreadline
+        pyreadline.Readline().parse_and_bind("tab: complete")
+        pyreadline.Readline().set_completer(completer)
+
+
+def print_startup_profile(timings):
+    pc.printout("\nStartup profile\n", pc.CYAN)
+    for step, seconds in timings.items():
+        print("%-10s %8.1f ms" % (step, seconds * 1000))
+    print("")
+
+
 def _quit():
     pc.printout("Goodbye!\n", pc.RED)
     sys.exit(0)
 
 
 signal.signal(signal.SIGINT, signal_handler)
-if is_windows:
-    pyreadline.Readline().parse_and_bind("tab: complete")
-    pyreadline.Readline().set_completer(completer)
-else:
-    gnureadline.parse_and_bind("tab: complete")
-    gnureadline.set_completer(completer)
 
 parser = argparse.ArgumentParser(description='Osintgram is a OSINT tool on Instagram. It offers an interactive shell '
                                              'to perform analysis on Instagram account of any users by its nickname ')
@@ -115,13 +277,56 @@ parser.add_argument('id', type=str,  # var = id
 parser.add_argument('-C','--cookies', help='clear\'s previous cookies', action="store_true")
 parser.add_argument('-j', '--json', help='save commands output as JSON file', action='store_true')
 parser.add_argument('-f', '--file', help='save output in a file', action='store_true')
-parser.add_argument('-c', '--command', help='run in single command mode & execute provided command', action='store')
+parser.add_argument('-c', '--command', help='run in single command mode & execute provided command, repeat it to '
+                                             'run several commands over one session', action='append')
+parser.add_argument('--script', help='run the commands listed in a file (one per line, - for stdin) and exit',
+                    action='store')
 parser.add_argument('-o', '--output', help='where to store photos', action='store')
+parser.add_argument('-s', '--sync', help='only download media missing from the output folder', action='store_true')
+parser.add_argument('--feed-depth', help='number of latest posts analysed (default 100)', type=depth_arg)
+parser.add_argument('--since', help='only analyse posts published since this date (yyyy-mm-dd)', type=date_arg)
+parser.add_argument('--profile-startup', help='report import, login and target setup timings', action='store_true')
+parser.add_argument('--no-cache', help='bypass the on-disk response cache', action='store_true')
+parser.add_argument('--purge-cache', help='empty the on-disk response cache before running', action='store_true')
+parser.add_argument('--profile', help='profile every command with cProfile, saving a .prof file in the output '
+                                         'folder', action='store_true')
+parser.add_argument('--trace-memory', help='trace allocations of every command with tracemalloc and save a report '
+                                              'in the output folder', action='store_true')
+parser.add_argument('--no-stats', help='do not print the stats summary after each command', action='store_true')
+parser.add_argument('--metrics-json', help='write the stats of every command to a JSON file', metavar='FILE')
+parser.add_argument('--metrics-prom', help='write the stats of the last command to a Prometheus textfile',
+                    metavar='FILE')
+parser.add_argument('--mock-cdn', help='download photos and stories from a local mock CDN (python -m src.mockcdn) '
+                                          'instead of Instagram', metavar='URL')
+cassette = parser.add_mutually_exclusive_group()
+cassette.add_argument('--record', help='record every Instagram response of the session to a cassette file',
+                      metavar='CASSETTE')
+cassette.add_argument('--replay', help='run offline, serving Instagram responses from a recorded cassette',
+                      metavar='CASSETTE')
+parser.add_argument('--replay-latency', help='seconds added to each replayed call, or \'recorded\' to replay the '
+                                             'recorded durations', type=latency_arg)
 
 args = parser.parse_args()
 
+profile_cpu = args.profile
+trace_memory = args.trace_memory
+
+registry.load_plugins(['src.analyzers'] + config.getPlugins())
+
+script = list(args.command or [])
+if args.script:
+    script += read_script(args.script)
 
-api = Osintgram(args.id, args.file, args.json, args.command, args.output, args.cookies)
+api = Osintgram(args.id, args.file, args.json, bool(script), args.output, args.cookies, not args.no_cache,
+                args.purge_cache, args.sync, args.feed_depth, args.since, record=args.record, replay=args.replay,
+                replay_latency=args.replay_latency, stats=not args.no_stats, metrics_json=args.metrics_json,
+                metrics_prom=args.metrics_prom, mock_cdn=args.mock_cdn)
+
+if args.profile_startup:
+    timings = {'imports': imports_time}
+    timings.update(api.startup_timings)
+    timings['total'] = time.perf_counter() - startup_started
+    print_startup_profile(timings)
 
 
 
@@ -130,75 +335,39 @@ commands = {
     'help':             cmdlist,
     'quit':             _quit,
     'exit':             _quit,
-    'addrs':            api.get_addrs,
-    'cache':            api.clear_cache,
-    'captions':         api.get_captions,
-    "commentdata":      api.get_comment_data,
-    'comments':         api.get_total_comments,
-    'followers':        api.get_followers,
-    'followings':       api.get_followings,
-    'fwersemail':       api.get_fwersemail,
-    'fwingsemail':      api.get_fwingsemail,
-    'fwersnumber':      api.get_fwersnumber,
-    'fwingsnumber':     api.get_fwingsnumber,
-    'hashtags':         api.get_hashtags,
-    'info':             api.get_user_info,
-    'likes':            api.get_total_likes,
-    'mediatype':        api.get_media_type,
-    'photodes':         api.get_photo_description,
-    'photos':           api.get_user_photo,
-    'propic':           api.get_user_propic,
-    'stories':          api.get_user_stories,
-    'tagged':           api.get_people_tagged_by_user,
-    'target':           api.change_target,
-    'wcommented':       api.get_people_who_commented,
-    'wtagged':          api.get_people_who_tagged
+    # Job control takes an argument and is handled by execute(), listed here for completion
+    'jobs':             None,
+    'wait':             None,
+    'cancel':           None,
 }
 
+for name in registry.commands:
+    commands[name] = functools.partial(api.run_command, name)
 
-signal.signal(signal.SIGINT, signal_handler)
-if is_windows:
-    pyreadline.Readline().parse_and_bind("tab: complete")
-    pyreadline.Readline().set_completer(completer)
-else:
-    gnureadline.parse_and_bind("tab: complete")
-    gnureadline.set_completer(completer)
 
-if not args.command:
-    printlogo()
+if script:
+    # Every command shares the login, target and caches of this session
+    summary = []
+    for cmd in script:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            if not execute(cmd):
+                status = "failed"
+        except Exception as e:
+            pc.printout("Error! " + cmd + ": " + (str(e) or type(e).__name__) + "\n", pc.RED)
+            status = "failed"
+        summary.append((cmd, time.perf_counter() - started, status))
+    if len(summary) > 1:
+        print_batch_summary(summary)
+    sys.exit(1 if any(status == "failed" for _, _, status in summary) else 0)
 
 
-while True:
-    if args.command:
-        cmd = args.command
-        _cmd = commands.get(args.command)
-    else:
-        signal.signal(signal.SIGINT, signal_handler)
-        if is_windows:
-            pyreadline.Readline().parse_and_bind("tab: complete")
-            pyreadline.Readline().set_completer(completer)
-        else:
-            gnureadline.parse_and_bind("tab: complete")
-            gnureadline.set_completer(completer)
-        pc.printout("Run a command: ", pc.YELLOW)
-        cmd = input()
-
-        _cmd = commands.get(cmd)
-
-    if _cmd:
-        _cmd()
-    elif cmd == "FILE=y":
-        api.set_write_file(True)
-    elif cmd == "FILE=n":
-        api.set_write_file(False)
-    elif cmd == "JSON=y":
-        api.set_json_dump(True)
-    elif cmd == "JSON=n":
-        api.set_json_dump(False)
-    elif cmd == "":
-        print("")
-    else:
-        pc.printout("Unknown command\n", pc.RED)
+printlogo()
 
-    if args.command:
-        break
+while True:
+    signal.signal(signal.SIGINT, signal_handler)
+    setup_readline()
+    jobs.report_finished()
+    pc.printout("Run a command: ", pc.YELLOW)
+    execute(input(), True)
@@ -1,9 +1,13 @@
 import datetime
+import functools
+import itertools
 import json
 import sys
-import urllib
 import os
 import codecs
+import contextlib
+import threading
+import time
 from pathlib import Path
 
 from instagrapi.exceptions import (
@@ -15,45 +19,110 @@ from instagrapi.exceptions import (
     UserNotFound
 )
 
-import requests
 import ssl
 ssl._create_default_https_context = ssl._create_unverified_context
 
-from geopy.geocoders import Nominatim
 from instagrapi import Client as AppClient
 
-from prettytable import PrettyTable
-
 from src import printcolors as pc
 from src import config
+from src import jobs
+from src.aggregate import UserCounter, taken_at
+from src import registry
+from src.checkpoint import Checkpoint
+from src.downloader import Downloader
+from src.cache import CachedClient, DiskCache, MemoryCache
+from src.cassette import Recorder, ReplayClient
+from src.manifest import Manifest
+from src.metrics import Instrumented, Metrics, print_summary, write_json, write_prometheus
+from src.geocoder import Geocoder, NominatimBackend, OfflineBackend
+from src.scheduler import RequestScheduler
+from src.session import SharedClient
+from src.sinks import JsonSink, TableSink
+
+
+def PrettyTable(*args, **kwargs):
+    # prettytable is only imported once a command actually renders a table
+    from prettytable import PrettyTable as Table
+    return Table(*args, **kwargs)
 
 
 class Osintgram:
     api = None
+    session = None
     api2 = None
-    geolocator = Nominatim(user_agent="http")
+    geolocator = None
     user_id = None
     target_id = None
+    target_user = None
     is_private = True
     following = False
     target = ""
     writeFile = False
     jsonDump = False
+    sync = False
+    feed_depth = 100
+    feed_since = None
+    command_options = None
+    startup_timings = None
     cli_mode = False
     output_dir = "output"
-
-    def __init__(self, target, is_file, is_json, is_cli, output_dir, clear_cookies):
-        self.output_dir = output_dir or self.output_dir        
+    feed_cache = None
+    response_cache = None
+    downloader = None
+    record = None
+    replay = None
+    replay_latency = None
+    metrics = None
+    metrics_reports = None
+    stats = True
+    metrics_json = None
+    metrics_prom = None
+
+    def __init__(self, target, is_file, is_json, is_cli, output_dir, clear_cookies, use_cache=True,
+                 purge_cache=False, is_sync=False, feed_depth=None, feed_since=None, record=None, replay=None,
+                 replay_latency=None, stats=True, metrics_json=None, metrics_prom=None, mock_cdn=None):
+        self.output_dir = output_dir or self.output_dir
+        self.command_options = threading.local()
+        self.metrics = Metrics()
+        self.metrics_reports = []
+        self.stats = stats
+        self.metrics_json = metrics_json
+        self.metrics_prom = metrics_prom
+        self.record = record
+        self.replay = replay
+        self.replay_latency = replay_latency
+        self.feed_cache = MemoryCache(config.getFeedCacheTtl())
+        if use_cache or purge_cache:
+            self.response_cache = DiskCache(config.getResponseCacheFile(), config.getResponseCacheTtls(),
+                                            config.getResponseCacheMaxBytes())
+        if purge_cache:
+            self.response_cache.purge()
+            if not use_cache:
+                self.response_cache = None
+        self.geolocator = self.build_geolocator()
+        self.downloader = Downloader(config.getDownloadWorkers(), config.getDownloadRetries(),
+                                     config.getDownloadTimeout(), self.metrics, mock_cdn)
         u = config.getUsername()
         p = config.getPassword()
         self.clear_cookies(clear_cookies)
         self.cli_mode = is_cli
         if not is_cli:
             print("\nAttempt to login...")
+        self.startup_timings = {}
+        started = time.perf_counter()
         self.login(u, p)
+        self.startup_timings['login'] = time.perf_counter() - started
+        started = time.perf_counter()
         self.setTarget(target)
+        self.startup_timings['setTarget'] = time.perf_counter() - started
         self.writeFile = is_file
         self.jsonDump = is_json
+        self.sync = is_sync
+        if feed_depth is None:
+            feed_depth = config.getFeedDepth()
+        self.feed_depth = self.parse_feed_depth(feed_depth)
+        self.feed_since = self.parse_feed_since(feed_since)
 
     def clear_cookies(self, clear_cookies):
         if clear_cookies:
@@ -64,38 +133,111 @@ class Osintgram:
         user = self.get_user(target)
         self.target_id = user['id']
         self.is_private = user['is_private']
+        # Kept for info and propic, so they don't fetch the profile again
+        self.target_user = user['user']
         self.following = self.check_following()
         self.__printTargetBanner__()
         self.output_dir = self.output_dir + "/" + str(self.target)
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
 
     def __get_feed__(self):
-        # Try to fetch up to 100 posts; adjust as needed
+        # The feed is shared by every analysis command, fetch it once per target and
+        # only page further when a command asks for more posts than already fetched
+        depth, since = self.__feed_settings__()
+        with self.feed_cache.lock(self.target_id):
+            feed = self.feed_cache.get(self.target_id)
+            if feed is None:
+                feed = {'medias': [], 'cursor': "", 'exhausted': False}
+
+            try:
+                while not feed['exhausted'] and len(feed['medias']) < depth:
+                    if since is not None and feed['medias'] and \
+                            taken_at(feed['medias'][-1]).date() < since:
+                        break
+                    amount = min(config.getFeedPageSize(), depth - len(feed['medias']))
+                    medias, cursor = self.api.user_medias_paginated(self.target_id, amount,
+                                                                    end_cursor=feed['cursor'])
+                    # Convert Media objects to dicts if needed
+                    for media in medias:
+                        if hasattr(media, 'dict'):
+                            feed['medias'].append(media.dict())
+                        else:
+                            feed['medias'].append(media)
+                    feed['cursor'] = cursor
+                    feed['exhausted'] = not medias or not cursor
+            except Exception as e:
+                pc.printout(f"Error fetching user feed: {e}\n", pc.RED)
+            self.feed_cache.set(self.target_id, feed)
+
+        data = feed['medias'][:depth]
+        if since is not None:
+            data = [post for post in data if taken_at(post).date() >= since]
+        return data
+
+    def parse_feed_depth(self, value):
+        depth = int(value)
+        if depth <= 0:
+            raise ValueError("feed depth must be a positive number")
+        return depth
+
+    def parse_feed_since(self, value):
+        if value is None or value == "":
+            return None
+        return datetime.datetime.strptime(str(value), '%Y-%m-%d').date()
+
+    @contextlib.contextmanager
+    def feed_options(self, depth=None, since=None):
+        # Fixes the feed depth and date cutoff of the command run by this thread, with
+        # optional overrides. They live in thread-local storage, so neither the overrides
+        # nor later DEPTH= / SINCE= changes reach commands running in the background.
+        options = self.command_options
+        saved = getattr(options, 'feed', None)
+        options.feed = (self.feed_depth if depth is None else self.parse_feed_depth(depth),
+                        self.feed_since if since is None else self.parse_feed_since(since))
         try:
-            medias = self.api.user_medias(self.target_id, amount=100)
-            # Convert Media objects to dicts if needed
-            data = []
-            for media in medias:
-                if hasattr(media, 'dict'):
-                    data.append(media.dict())
-                else:
-                    data.append(media)
-            return data
-        except Exception as e:
-            pc.printout(f"Error fetching user feed: {e}\n", pc.RED)
-            return []
+            yield
+        finally:
+            options.feed = saved
+
+    def __feed_settings__(self):
+        return getattr(self.command_options, 'feed', None) or (self.feed_depth, self.feed_since)
 
     def __get_comments__(self, media_id):
-        comments = []
-        result = self.api.media_comments(str(media_id))
-        comments.extend(result.get('comments', []))
-        next_max_id = result.get('next_max_id')
+        checkpoint = Checkpoint(self.output_dir + "/" + self.target + "_comments_" + str(media_id))
+        state = checkpoint.load()
+        if state is None:
+            result = self.api.media_comments(str(media_id))
+            checkpoint.add_rows(result.get('comments', []))
+            next_max_id = result.get('next_max_id')
+            checkpoint.save(next_max_id=next_max_id)
+        else:
+            next_max_id = state['next_max_id']
         while next_max_id:
             results = self.api.media_comments(str(media_id), max_id=next_max_id)
-            comments.extend(results.get('comments', []))
+            checkpoint.add_rows(results.get('comments', []))
             next_max_id = results.get('next_max_id')
+            checkpoint.save(next_max_id=next_max_id)
+        comments = list(checkpoint.rows())
+        checkpoint.clear()
         return comments
 
+    def __get_feed_comments__(self, data):
+        # Comment threads of the given posts, shared by the commands needing them.
+        # Only threads not fetched yet in this session hit the API.
+        key = (self.target_id, 'comments')
+        with self.feed_cache.lock(key):
+            threads = self.feed_cache.get(key) or {}
+            missing = [post for post in data if post['id'] not in threads]
+            for post, comments in zip(missing,
+                                      self.__map_posts__(lambda post: self.__get_comments__(post['id']), missing)):
+                threads[post['id']] = comments
+            self.feed_cache.set(key, threads)
+        return [threads[post['id']] for post in data]
+
+    def __map_posts__(self, fn, posts):
+        # Runs fn for several posts at once and yields the results in post order
+        return self.session.map(fn, posts)
+
     def __printTargetBanner__(self):
         pc.printout("\nLogged as ", pc.GREEN)
         pc.printout(self.api.username, pc.CYAN)
@@ -110,161 +252,67 @@ class Osintgram:
             pc.printout(" [NOT FOLLOWING]", pc.RED)
         print('\n')
 
-    def change_target(self):
-        pc.printout("Insert new target username: ", pc.YELLOW)
-        line = input()
-        self.setTarget(line)
-        return
-
-    def get_addrs(self):
-        if self.check_private_profile():
-            return
-        pc.printout("Searching for target localizations...\n")
-        data = self.__get_feed__()
-        locations = {}
-        for post in data:
-            if 'location' in post and post['location'] is not None:
-                if 'lat' in post['location'] and 'lng' in post['location']:
-                    lat = post['location']['lat']
-                    lng = post['location']['lng']
-                    locations[str(lat) + ', ' + str(lng)] = post.get('taken_at')
-        address = {}
-        for k, v in locations.items():
-            details = self.geolocator.reverse(k)
-            unix_timestamp = datetime.datetime.fromtimestamp(v)
-            address[details.address] = unix_timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        sort_addresses = sorted(address.items(), key=lambda p: p[1], reverse=True)
-        if len(sort_addresses) > 0:
-            t = PrettyTable()
-            t.field_names = ['Post', 'Address', 'time']
-            t.align["Post"] = "l"
-            t.align["Address"] = "l"
-            t.align["Time"] = "l"
-            pc.printout("\nWoohoo! We found " + str(len(sort_addresses)) + " addresses\n", pc.GREEN)
-            i = 1
-            json_data = {}
-            addrs_list = []
-            for address, time in sort_addresses:
-                t.add_row([str(i), address, time])
-                if self.jsonDump:
-                    addr = {
-                        'address': address,
-                        'time': time
-                    }
-                    addrs_list.append(addr)
-                i = i + 1
-            if self.writeFile:
-                file_name = self.output_dir + "/" + self.target + "_addrs.txt"
-                file = open(file_name, "w")
-                file.write(str(t))
-                file.close()
-            if self.jsonDump:
-                json_data['address'] = addrs_list
-                json_file_name = self.output_dir + "/" + self.target + "_addrs.json"
-                with open(json_file_name, 'w') as f:
-                    json.dump(json_data, f)
-            print(t)
+    def build_geolocator(self):
+        if config.getGeocoderBackend() == "offline":
+            backend = OfflineBackend(config.getGeocoderDataset())
         else:
-            pc.printout("Sorry! No results found :-(\n", pc.RED)
-
-    def get_captions(self):
-        if self.check_private_profile():
+            backend = NominatimBackend()
+        if self.metrics is not None:
+            # Only lookups missing from the geocode cache reach the backend
+            backend = Instrumented(backend, self.metrics, "geocoder")
+        cache = DiskCache(config.getGeocodeCacheFile(), {'geocode': config.getGeocodeCacheTtl()},
+                          config.getGeocodeCacheMaxBytes())
+        return Geocoder(backend, cache, config.getGeocodePrecision())
+
+    def run_command(self, name):
+        command = registry.commands[name]
+        needs_target_data = any(need in command.needs for need in ('feed', 'comments', 'stories'))
+        if needs_target_data and self.check_private_profile():
             return
-
-        pc.printout("Searching for target captions...\n")
-
-        captions = []
-
-        data = self.__get_feed__()
-        counter = 0
-
+        self.metrics.reset(name)
         try:
-            for item in data:
-                if "caption" in item:
-                    if item["caption"] is not None:
-                        text = item["caption"]["text"]
-                        captions.append(text)
-                        counter = counter + 1
-                        sys.stdout.write("\rFound %i" % counter)
-                        sys.stdout.flush()
-
-        except AttributeError:
-            pass
-
-        except KeyError:
-            pass
-
-        json_data = {}
-
-        if counter > 0:
-            pc.printout("\nWoohoo! We found " + str(counter) + " captions\n", pc.GREEN)
-
-            file = None
-
-            if self.writeFile:
-                file_name = self.output_dir + "/" + self.target + "_captions.txt"
-                file = open(file_name, "w")
-
-            for s in captions:
-                print(s + "\n")
-
-                if self.writeFile:
-                    file.write(s + "\n")
-
-            if self.jsonDump:
-                json_data['captions'] = captions
-                json_file_name = self.output_dir + "/" + self.target + "_followings.json"
-                with open(json_file_name, 'w') as f:
-                    json.dump(json_data, f)
-
-            if file is not None:
-                file.close()
-
-        else:
-            pc.printout("Sorry! No results found :-(\n", pc.RED)
-
+            command.run(self, self.load_inputs(command.needs))
+        finally:
+            self.report_metrics()
+
+    def report_metrics(self):
+        report = self.metrics.report()
+        if self.stats:
+            print_summary(report)
+        if self.metrics_json:
+            self.metrics_reports.append(report)
+            write_json(self.metrics_reports, self.metrics_json)
+        if self.metrics_prom:
+            write_prometheus(report, self.metrics_prom)
+
+    def load_inputs(self, needs):
+        inputs = {}
+        if 'feed' in needs or 'comments' in needs:
+            inputs['feed'] = self.__get_feed__()
+        if 'comments' in needs:
+            inputs['comments'] = dict(zip((post['id'] for post in inputs['feed']),
+                                          self.__get_feed_comments__(inputs['feed'])))
+        if 'stories' in needs:
+            inputs['stories'] = self.api.user_reel_media(str(self.target_id))
+        if 'profile' in needs:
+            inputs['profile'] = self.target_user
+        return inputs
+
+    def change_target(self, username=None):
+        if username is None:
+            if self.__interactive__():
+                pc.printout("Insert new target username: ", pc.YELLOW)
+                username = input()
+            else:
+                raise ValueError("target needs a username here, e.g. 'target <username>'")
+        self.feed_cache.invalidate(self.target_id)
+        self.feed_cache.invalidate((self.target_id, 'comments'))
+        self.setTarget(username)
         return
 
-    def get_total_comments(self):
-        if self.check_private_profile():
-            return
-
-        pc.printout("Searching for target total comments...\n")
-
-        comments_counter = 0
-        posts = 0
-
-        data = self.__get_feed__()
-
-        for post in data:
-            comments_counter += post['comment_count']
-            posts += 1
-
-        if self.writeFile:
-            file_name = self.output_dir + "/" + self.target + "_comments.txt"
-            file = open(file_name, "w")
-            file.write(str(comments_counter) + " comments in " + str(posts) + " posts\n")
-            file.close()
-
-        if self.jsonDump:
-            json_data = {
-                'comment_counter': comments_counter,
-                'posts': posts
-            }
-            json_file_name = self.output_dir + "/" + self.target + "_comments.json"
-            with open(json_file_name, 'w') as f:
-                json.dump(json_data, f)
-
-        pc.printout(str(comments_counter), pc.MAGENTA)
-        pc.printout(" comments in " + str(posts) + " posts\n")
-
-    def get_comment_data(self):
-        if self.check_private_profile():
-            return
-
+    def get_comment_data(self, feed, comments):
         pc.printout("Retrieving all comments, this may take a moment...\n")
-        data = self.__get_feed__()
-        
+
         _comments = []
         t = PrettyTable(['POST ID', 'ID', 'Username', 'Comment'])
         t.align["POST ID"] = "l"
@@ -272,10 +320,9 @@ class Osintgram:
         t.align["Username"] = "l"
         t.align["Comment"] = "l"
 
-        for post in data:
+        for post in feed:
             post_id = post.get('id')
-            comments = self.api.media_n_comments(post_id)
-            for comment in comments:
+            for comment in comments[post_id]:
                 t.add_row([post_id, comment.get('user_id'), comment.get('user').get('username'), comment.get('text')])
                 comment = {
                         "post_id": post_id,
@@ -306,56 +353,7 @@ class Osintgram:
 
         pc.printout("Searching for target followers...\n")
 
-        _followers = []
-        followers = []
-
-
-        rank_token = self.api.generate_uuid()  # was AppClient.generate_uuid()
-        data = self.api.user_followers(str(self.target_id), rank_token=rank_token)
-
-        _followers.extend(data.get('users', []))
-
-        next_max_id = data.get('next_max_id')
-        while next_max_id:
-            sys.stdout.write("\rCatched %i followers" % len(_followers))
-            sys.stdout.flush()
-            results = self.api.user_followers(str(self.target_id), rank_token=rank_token, max_id=next_max_id)
-            _followers.extend(results.get('users', []))
-            next_max_id = results.get('next_max_id')
-
-        print("\n")
-            
-        for user in _followers:
-            u = {
-                'id': user['pk'],
-                'username': user['username'],
-                'full_name': user['full_name']
-            }
-            followers.append(u)
-
-        t = PrettyTable(['ID', 'Username', 'Full Name'])
-        t.align["ID"] = "l"
-        t.align["Username"] = "l"
-        t.align["Full Name"] = "l"
-
-        json_data = {}
-
-        for node in followers:
-            t.add_row([str(node['id']), node['username'], node['full_name']])
-
-        if self.writeFile:
-            file_name = self.output_dir + "/" + self.target + "_followers.txt"
-            file = open(file_name, "w")
-            file.write(str(t))
-            file.close()
-
-        if self.jsonDump:
-            json_data['followers'] = followers
-            json_file_name = self.output_dir + "/" + self.target + "_followers.json"
-            with open(json_file_name, 'w') as f:
-                json.dump(json_data, f)
-
-        print(t)
+        self.__stream_users__(self.api.user_followers, "followers")
 
     def get_followings(self):
         if self.check_private_profile():
@@ -363,63 +361,88 @@ class Osintgram:
 
         pc.printout("Searching for target followings...\n")
 
-        _followings = []
-        followings = []
+        self.__stream_users__(self.api.user_following, "followings")
 
-        rank_token = self.api.generate_uuid()  # was AppClient.generate_uuid()
-        data = self.api.user_following(str(self.target_id), rank_token=rank_token)
-
-        _followings.extend(data.get('users', []))
+    def __paginate_users__(self, endpoint, target_id, rank_token=None, next_max_id=None):
+        # Yields (users, rank_token, next_max_id) one page at a time instead of collecting
+        # the whole listing. Passing a saved cursor resumes from that page.
+        if rank_token is None:
+            rank_token = self.api.generate_uuid()  # was AppClient.generate_uuid()
+            data = endpoint(str(target_id), rank_token=rank_token)
+            next_max_id = data.get('next_max_id')
+            yield data.get('users', []), rank_token, next_max_id
 
-        next_max_id = data.get('next_max_id')
         while next_max_id:
-            sys.stdout.write("\rCatched %i followings" % len(_followings))
-            sys.stdout.flush()
-            results = self.api.user_following(str(self.target_id), rank_token=rank_token, max_id=next_max_id)
-            _followings.extend(results.get('users', []))
+            results = endpoint(str(target_id), rank_token=rank_token, max_id=next_max_id)
             next_max_id = results.get('next_max_id')
-
-        print("\n")
-
-        for user in _followings:
-            u = {
-                'id': user['pk'],
-                'username': user['username'],
-                'full_name': user['full_name']
-            }
-            followings.append(u)
-
-        t = PrettyTable(['ID', 'Username', 'Full Name'])
-        t.align["ID"] = "l"
-        t.align["Username"] = "l"
-        t.align["Full Name"] = "l"
-
-        json_data = {}
-        followings_list = []
-
-        for node in followings:
-            t.add_row([str(node['id']), node['username'], node['full_name']])
-            if self.jsonDump:
-                follow = {
-                    'id': node['id'],
-                    'username': node['username'],
-                    'full_name': node['full_name']
-                }
-                followings_list.append(follow)
-
+            yield results.get('users', []), rank_token, next_max_id
+
+    def __stream_users__(self, endpoint, name):
+        # The whole crawl sticks to the target it started on
+        target_id = self.target_id
+        base_name = self.output_dir + "/" + self.target + "_" + name
+        checkpoint = Checkpoint(base_name)
+        state = checkpoint.load()
+        if state is not None:
+            pc.printout("Resuming from a previous run (" + str(state['count']) + " " + name + ")\n", pc.YELLOW)
+
+        file_name = None
         if self.writeFile:
-            file_name = self.output_dir + "/" + self.target + "_followings.txt"
-            file = open(file_name, "w")
-            file.write(str(t))
-            file.close()
+            file_name = base_name + ".txt"
+        t = TableSink(['ID', 'Username', 'Full Name'], [20, 30, 40], file_name)
 
+        j = None
         if self.jsonDump:
-            json_data['followings'] = followings_list
-            json_file_name = self.output_dir + "/" + self.target + "_followings.json"
-            with open(json_file_name, 'w') as f:
-                json.dump(json_data, f)
+            json_file_name = base_name + ".json"
+            j = JsonSink(json_file_name, name)
 
-        print(t)
+        counter = 0
+        try:
+            if state is not None:
+                # Replay the rows of the interrupted run into the new output
+                pages = [(checkpoint.rows(), None, None)]
+                if state['next_max_id']:
+                    resumed = self.__paginate_users__(endpoint, target_id, state['rank_token'], state['next_max_id'])
+                    pages = itertools.chain(pages, resumed)
+            else:
+                pages = self.__paginate_users__(endpoint, target_id)
+
+            for users, rank_token, next_max_id in pages:
+                page_counter = 0
+                for user in users:
+                    t.add_row([str(user['pk']), user['username'], user['full_name']])
+                    if j is not None:
+                        j.add({
+                            'id': user['pk'],
+                            'username': user['username'],
+                            'full_name': user['full_name']
+                        })
+                    if rank_token is not None:
+                        checkpoint.add_rows([{
+                            'pk': user['pk'],
+                            'username': user['username'],
+                            'full_name': user['full_name']
+                        }])
+                    page_counter += 1
+                counter += page_counter
+                t.flush()
+                if j is not None:
+                    j.flush()
+                if rank_token is not None:
+                    checkpoint.save(rank_token=rank_token, next_max_id=next_max_id, count=counter)
+        except (ClientThrottledError, PleaseWaitFewMinutes):
+            pc.printout("\nError: Instagram blocked the requests. Please wait a few minutes before you try again.",
+                        pc.RED)
+            pc.printout("\nProgress saved, run the command again to resume from " + str(counter) + " " + name + "\n")
+            return
+        finally:
+            t.close()
+            if j is not None:
+                j.close()
+            checkpoint.close()
+
+        checkpoint.clear()
+        pc.printout("\nFound " + str(counter) + " " + name + "\n", pc.GREEN)
 
     def get_fwingsnumber(self):
         if self.check_private_profile():
@@ -458,8 +481,7 @@ class Osintgram:
        
             results = []
         
-            pc.printout("Do you want to get all phone numbers? y/n: ", pc.YELLOW)
-            value = input()
+            value = self.__ask__("Do you want to get all phone numbers? y/n: ", "y")
             
             if value.lower() in ["y", "yes"]:
                 value = len(followings)
@@ -536,7 +558,7 @@ class Osintgram:
             pc.printout("Searching for phone numbers of users followers... this can take a few minutes\n")
 
             rank_token = self.api.generate_uuid()  # was AppClient.generate_uuid()
-            data = self.api.user_following(str(self.target_id), rank_token=rank_token)
+            data = self.api.user_followers(str(self.target_id), rank_token=rank_token)
 
             for user in data.get('users', []):
                 u = {
@@ -549,7 +571,7 @@ class Osintgram:
             next_max_id = data.get('next_max_id')
             
             while next_max_id:
-                results = self.api.user_following(str(self.target_id), rank_token=rank_token, max_id=next_max_id)
+                results = self.api.user_followers(str(self.target_id), rank_token=rank_token, max_id=next_max_id)
 
                 for user in results.get('users', []):
                     u = {
@@ -563,8 +585,7 @@ class Osintgram:
         
             results = []
             
-            pc.printout("Do you want to get all phone numbers? y/n: ", pc.YELLOW)
-            value = input()
+            value = self.__ask__("Do you want to get all phone numbers? y/n: ", "y")
             
             if value.lower() in ["y", "yes"]:
                 value = len(followings)
@@ -631,82 +652,17 @@ class Osintgram:
         else:
             pc.printout("Sorry! No results found :-(\n", pc.RED)
 
-    def get_media_type(self):
-        if self.check_private_profile():
-            return
-
-        pc.printout("Searching for target captions...\n")
-
-        counter = 0
-        photo_counter = 0
-        video_counter = 0
-
-        data = self.__get_feed__()
-
-        for post in data:
-            if "media_type" in post:
-                if post["media_type"] == 1:
-                    photo_counter = photo_counter + 1
-                elif post["media_type"] == 2:
-                    video_counter = video_counter + 1
-                counter = counter + 1
-                sys.stdout.write("\rChecked %i" % counter)
-                sys.stdout.flush()
-
-        sys.stdout.write(" posts")
-        sys.stdout.flush()
-
-        if counter > 0:
-
-            if self.writeFile:
-                file_name = self.output_dir + "/" + self.target + "_mediatype.txt"
-                file = open(file_name, "w")
-                file.write(str(photo_counter) + " photos and " + str(video_counter) + " video posted by target\n")
-                file.close()
-
-            pc.printout("\nWoohoo! We found " + str(photo_counter) + " photos and " + str(video_counter) +
-                        " video posted by target\n", pc.GREEN)
-
-            if self.jsonDump:
-                json_data = {
-                    "photos": photo_counter,
-                    "videos": video_counter
-                }
-                json_file_name = self.output_dir + "/" + self.target + "_mediatype.json"
-                with open(json_file_name, 'w') as f:
-                    json.dump(json_data, f)
-
-        else:
-            pc.printout("Sorry! No results found :-(\n", pc.RED)
-
-    def get_people_who_commented(self):
-        if self.check_private_profile():
-            return
-
+    def get_people_who_commented(self, feed, comments):
         pc.printout("Searching for users who commented...\n")
 
-        data = self.__get_feed__()
-        users = []
-
-        for post in data:
-            comments = self.__get_comments__(post['id'])
-            for comment in comments:
-                if not any(u['id'] == comment['user']['pk'] for u in users):
-                    user = {
-                        'id': comment['user']['pk'],
-                        'username': comment['user']['username'],
-                        'full_name': comment['user']['full_name'],
-                        'counter': 1
-                    }
-                    users.append(user)
-                else:
-                    for user in users:
-                        if user['id'] == comment['user']['pk']:
-                            user['counter'] += 1
-                            break
+        users = UserCounter()
+
+        for post in feed:
+            for comment in comments[post['id']]:
+                users.add(comment['user'])
 
         if len(users) > 0:
-            ssort = sorted(users, key=lambda value: value['counter'], reverse=True)
+            ssort = users.top()
 
             json_data = {}
 
@@ -750,31 +706,19 @@ class Osintgram:
 
         next_max_id = result.get('next_max_id')
         while next_max_id:
-            results = self.api.user_feed(str(self.target_id), max_id=next_max_id)
+            results = self.api.usertag_feed(self.target_id, max_id=next_max_id)
             posts.extend(results.get('items', []))
             next_max_id = results.get('next_max_id')
 
         if len(posts) > 0:
             pc.printout("\nWoohoo! We found " + str(len(posts)) + " photos\n", pc.GREEN)
 
-            users = []
+            users = UserCounter()
 
             for post in posts:
-                if not any(u['id'] == post['user']['pk'] for u in users):
-                    user = {
-                        'id': post['user']['pk'],
-                        'username': post['user']['username'],
-                        'full_name': post['user']['full_name'],
-                        'counter': 1
-                    }
-                    users.append(user)
-                else:
-                    for user in users:
-                        if user['id'] == post['user']['pk']:
-                            user['counter'] += 1
-                            break
+                users.add(post['user'])
 
-            ssort = sorted(users, key=lambda value: value['counter'], reverse=True)
+            ssort = users.top()
 
             json_data = {}
 
@@ -805,66 +749,12 @@ class Osintgram:
         else:
             pc.printout("Sorry! No results found :-(\n", pc.RED)
 
-    def get_photo_description(self):
-        if self.check_private_profile():
-            return
-
-        content = requests.get("https://www.instagram.com/" + str(self.target) + "/?__a=1")
-        data = content.json()
-
-        dd = data['graphql']['user']['edge_owner_to_timeline_media']['edges']
-
-        if len(dd) > 0:
-            pc.printout("\nWoohoo! We found " + str(len(dd)) + " descriptions\n", pc.GREEN)
-
-            count = 1
-
-            t = PrettyTable(['Photo', 'Description'])
-            t.align["Photo"] = "l"
-            t.align["Description"] = "l"
-
-            json_data = {}
-            descriptions_list = []
-
-            for i in dd:
-                node = i.get('node')
-                descr = node.get('accessibility_caption')
-                t.add_row([str(count), descr])
-
-                if self.jsonDump:
-                    description = {
-                        'description': descr
-                    }
-                    descriptions_list.append(description)
-
-                count += 1
-
-            if self.writeFile:
-                file_name = self.output_dir + "/" + self.target + "_photodes.txt"
-                file = open(file_name, "w")
-                file.write(str(t))
-                file.close()
-
-            if self.jsonDump:
-                json_data['descriptions'] = descriptions_list
-                json_file_name = self.output_dir + "/" + self.target + "_descriptions.json"
-                with open(json_file_name, 'w') as f:
-                    json.dump(json_data, f)
-
-            print(t)
-        else:
-            pc.printout("Sorry! No results found :-(\n", pc.RED)
-
     def get_user_photo(self):
         if self.check_private_profile():
             return
 
         limit = -1
-        if self.cli_mode:
-            user_input = ""
-        else:
-            pc.printout("How many photos you want to download (default all): ", pc.YELLOW)
-            user_input = input()
+        user_input = self.__ask__("How many photos you want to download (default all): ", "")
           
         try:
             if user_input == "":
@@ -877,42 +767,31 @@ class Osintgram:
             pc.printout("Wrong value entered\n", pc.RED)
             return
 
-        data = []
         counter = 0
+        skipped = 0
 
-        result = self.api.user_feed(str(self.target_id))
-        data.extend(result.get('items', []))
-
-        next_max_id = result.get('next_max_id')
-        while next_max_id:
-            results = self.api.user_feed(str(self.target_id), max_id=next_max_id)
-            data.extend(results.get('items', []))
-            next_max_id = results.get('next_max_id')
+        manifest = None
+        if self.sync:
+            manifest = Manifest(self.output_dir, self.target + "_manifest.json")
 
+        batch = self.downloader.batch()
         try:
-            for item in data:
-                if counter == limit:
-                    break
+            # Downloads start while the next feed pages are still being fetched,
+            # and reaching the limit stops the paging as well
+            for item in self.__iter_user_feed__(manifest):
                 if "image_versions2" in item:
-                    counter = counter + 1
-                    url = item["image_versions2"]["candidates"][0]["url"]
-                    photo_id = item["id"]
-                    end = self.output_dir + "/" + self.target + "_" + photo_id + ".jpg"
-                    urllib.request.urlretrieve(url, end)
-                    sys.stdout.write("\rDownloaded %i" % counter)
-                    sys.stdout.flush()
+                    medias = [item]
                 else:
-                    carousel = item["carousel_media"]
-                    for i in carousel:
-                        if counter == limit:
-                            break
+                    medias = item["carousel_media"]
+                for i in medias:
+                    if counter == limit:
+                        break
+                    if self.__download_photo__(i, manifest, batch):
                         counter = counter + 1
-                        url = i["image_versions2"]["candidates"][0]["url"]
-                        photo_id = i["id"]
-                        end = self.output_dir + "/" + self.target + "_" + photo_id + ".jpg"
-                        urllib.request.urlretrieve(url, end)
-                        sys.stdout.write("\rDownloaded %i" % counter)
-                        sys.stdout.flush()
+                    else:
+                        skipped = skipped + 1
+                if counter == limit:
+                    break
 
         except AttributeError:
             pass
@@ -920,19 +799,81 @@ class Osintgram:
         except KeyError:
             pass
 
+        counter, failed = batch.wait()
+
         sys.stdout.write(" photos")
         sys.stdout.flush()
 
+        if manifest is not None:
+            if limit == -1 and failed == 0:
+                manifest.complete = True
+            manifest.save()
+
         pc.printout("\nWoohoo! We downloaded " + str(counter) + " photos (saved in " + self.output_dir + " folder) \n", pc.GREEN)
+        if skipped > 0:
+            pc.printout(str(skipped) + " photos were already synced\n", pc.GREEN)
+
+    def __iter_user_feed__(self, manifest=None):
+        # Media downloaded by this run is added to the manifest as it completes, only
+        # what was on disk before tells where the previous sync stopped
+        known = None
+        if manifest is not None and manifest.complete:
+            known = {name for name in list(manifest.files) if manifest.has(name)}
 
-    def get_user_propic(self):
+        result = self.api.user_feed(str(self.target_id))
+        items = result.get('items', [])
+        yield from items
+
+        next_max_id = result.get('next_max_id')
+        first_page = True
+        while next_max_id and not self.__feed_synced__(known, items, first_page):
+            results = self.api.user_feed(str(self.target_id), max_id=next_max_id)
+            items = results.get('items', [])
+            yield from items
+            next_max_id = results.get('next_max_id')
+            first_page = False
+
+    def __download_photo__(self, media, manifest, batch):
+        name = self.target + "_" + media["id"] + ".jpg"
+        if manifest is not None and manifest.has(name):
+            return False
+        url = media["image_versions2"]["candidates"][0]["url"]
+        callback = None
+        if manifest is not None:
+            callback = functools.partial(manifest.add, name)
+        batch.submit(url, self.output_dir + "/" + name, callback)
+        return True
+
+    def __feed_synced__(self, known, items, first_page):
+        # After a complete sync, reaching media already on disk means the older ones are there too.
+        # Pinned posts lead the first page whatever their age, so there a synced post only counts
+        # after a new one, or when the whole page is synced.
+        if known is None:
+            return False
+        after_new = not first_page
+        for item in items:
+            medias = item.get("carousel_media") or [item]
+            if all(self.target + "_" + m["id"] + ".jpg" in known for m in medias):
+                if after_new:
+                    return True
+            else:
+                after_new = True
+        return not after_new
+
+    def get_user_propic(self, profile):
         try:
-            user = self.api.user_info_by_username(self.target)
+            user = profile
             url = getattr(user, "profile_pic_url_hd", None) or user.profile_pic_url
             if url:
                 end = self.output_dir + "/" + self.target + "_propic.jpg"
-                urllib.request.urlretrieve(str(url), end)  # Ensure url is a string
-                pc.printout("Target propic saved in output folder\n", pc.GREEN)
+                batch = self.downloader.batch()
+                batch.submit(url, end)
+                completed, failed = batch.wait()
+                print("")
+                if completed:
+                    pc.printout("Target propic saved in output folder\n", pc.GREEN)
+                else:
+                    pc.printout("Sorry! Download of the propic failed :-(\n", pc.RED)
             else:
                 pc.printout("Sorry! No results found :-(\n", pc.RED)
         except ClientError as e:
@@ -941,105 +882,49 @@ class Osintgram:
             print(error.get('error_title', ''))
             exit(2)
 
-    def get_user_stories(self):
-        if self.check_private_profile():
-            return
-
+    def get_user_stories(self, stories):
         pc.printout("Searching for target stories...\n")
 
-        data = self.api.user_reel_media(str(self.target_id))
-
         counter = 0
+        skipped = 0
+
+        manifest = None
+        if self.sync:
+            manifest = Manifest(self.output_dir, self.target + "_manifest.json")
 
-        if data['items'] is not None:  # no stories avaibile
-            counter = data['media_count']
-            for i in data['items']:
+        batch = self.downloader.batch()
+        if stories['items'] is not None:  # no stories avaibile
+            for i in stories['items']:
                 story_id = i["id"]
                 if i["media_type"] == 1:  # it's a photo
                     url = i['image_versions2']['candidates'][0]['url']
-                    end = self.output_dir + "/" + self.target + "_" + story_id + ".jpg"
-                    urllib.request.urlretrieve(url, end)
+                    name = self.target + "_" + story_id + ".jpg"
 
                 elif i["media_type"] == 2:  # it's a gif or video
                     url = i['video_versions'][0]['url']
-                    end = self.output_dir + "/" + self.target + "_" + story_id + ".mp4"
-                    urllib.request.urlretrieve(url, end)
+                    name = self.target + "_" + story_id + ".mp4"
 
-        if counter > 0:
-            pc.printout(str(counter) + " target stories saved in output folder\n", pc.GREEN)
-        else:
-            pc.printout("Sorry! No results found :-(\n", pc.RED)
-
-    def get_people_tagged_by_user(self):
-        pc.printout("Searching for users tagged by target...\n")
-
-        ids = []
-        username = []
-        full_name = []
-        post = []
-        counter = 1
+                else:
+                    continue
 
-        data = self.__get_feed__()
+                if manifest is not None:
+                    if manifest.has(name):
+                        skipped = skipped + 1
+                        continue
+                    batch.submit(url, self.output_dir + "/" + name, functools.partial(manifest.add, name))
+                else:
+                    batch.submit(url, self.output_dir + "/" + name)
 
-        try:
-            for i in data:
-                if "usertags" in i:
-                    c = i.get('usertags').get('in')
-                    for cc in c:
-                        if cc.get('user').get('pk') not in ids:
-                            ids.append(cc.get('user').get('pk'))
-                            username.append(cc.get('user').get('username'))
-                            full_name.append(cc.get('user').get('full_name'))
-                            post.append(1)
-                        else:
-                            index = ids.index(cc.get('user').get('pk'))
-                            post[index] += 1
-                        counter = counter + 1
-        except AttributeError as ae:
-            pc.printout("\nERROR: an error occurred: ", pc.RED)
-            print(ae)
+            counter, failed = batch.wait()
             print("")
-            pass
-
-        if len(ids) > 0:
-            t = PrettyTable()
-
-            t.field_names = ['Posts', 'Full Name', 'Username', 'ID']
-            t.align["Posts"] = "l"
-            t.align["Full Name"] = "l"
-            t.align["Username"] = "l"
-            t.align["ID"] = "l"
-
-            pc.printout("\nWoohoo! We found " + str(len(ids)) + " (" + str(counter) + ") users\n", pc.GREEN)
 
-            json_data = {}
-            tagged_list = []
-
-            for i in range(len(ids)):
-                t.add_row([post[i], full_name[i], username[i], str(ids[i])])
-
-                if self.jsonDump:
-                    tag = {
-                        'post': post[i],
-                        'full_name': full_name[i],
-                        'username': username[i],
-                        'id': ids[i]
-                    }
-                    tagged_list.append(tag)
-
-            if self.writeFile:
-                file_name = self.output_dir + "/" + self.target + "_tagged.txt"
-                file = open(file_name, "w")
-                file.write(str(t))
-                file.close()
+            if manifest is not None:
+                manifest.save()
+                if skipped > 0:
+                    pc.printout(str(skipped) + " target stories were already synced\n", pc.GREEN)
 
-            if self.jsonDump:
-                json_data['tagged'] = tagged_list
-                json_file_name = self.output_dir + "/" + self.target + "_tagged.json"
-                with open(json_file_name, 'w') as f:
-                    json.dump(json_data, f)
-
-            print(t)
+        if counter > 0:
+            pc.printout(str(counter) + " target stories saved in output folder\n", pc.GREEN)
         else:
             pc.printout("Sorry! No results found :-(\n", pc.RED)
 
@@ -1054,6 +939,7 @@ class Osintgram:
             user = dict()
             user['id'] = user_obj.pk
             user['is_private'] = user_obj.is_private
+            user['user'] = user_obj
 
             return user
         except UserNotFound as e:
@@ -1098,7 +984,60 @@ class Osintgram:
 
         self.jsonDump = flag
 
+    def set_feed_depth(self, value):
+        try:
+            self.feed_depth = self.parse_feed_depth(value)
+        except ValueError:
+            pc.printout("Error! Please enter a valid number of posts\n", pc.RED)
+            return
+        pc.printout("Feed depth: ")
+        pc.printout(str(self.feed_depth) + " posts", pc.GREEN)
+        pc.printout("\n")
+
+    def set_feed_since(self, value):
+        try:
+            self.feed_since = self.parse_feed_since(value)
+        except ValueError:
+            pc.printout("Error! Please enter a date like 2025-01-01\n", pc.RED)
+            return
+        pc.printout("Posts since: ")
+        if self.feed_since is None:
+            pc.printout("disabled", pc.RED)
+        else:
+            pc.printout(str(self.feed_since), pc.GREEN)
+        pc.printout("\n")
+
+    def set_stats(self, flag):
+        if flag:
+            pc.printout("Command stats: ")
+            pc.printout("enabled", pc.GREEN)
+            pc.printout("\n")
+        else:
+            pc.printout("Command stats: ")
+            pc.printout("disabled", pc.RED)
+            pc.printout("\n")
+
+        self.stats = flag
+
+    def set_sync(self, flag):
+        if flag:
+            pc.printout("Incremental sync: ")
+            pc.printout("enabled", pc.GREEN)
+            pc.printout("\n")
+        else:
+            pc.printout("Incremental sync: ")
+            pc.printout("disabled", pc.RED)
+            pc.printout("\n")
+
+        self.sync = flag
+
     def login(self, u, p):
+        if self.replay:
+            # Offline session served from a cassette, nothing to log in to
+            self.api = ReplayClient(self.replay, self.replay_latency)
+            self.session = SharedClient(self.api, config.getApiWorkers())
+            self.api = Instrumented(self.api, self.metrics, "api")
+            return
         try:
             settings_file = "config/settings.json"
             if not os.path.isfile(settings_file):
@@ -1113,6 +1052,17 @@ class Osintgram:
                 # reuse auth settings
                 self.api = AppClient(settings=cached_settings)
                 self.api.login(u, p)
+            self.session = SharedClient(self.api, config.getApiWorkers())
+            self.api = RequestScheduler(self.session, config.getRequestsPerSecond(), config.getRequestsBurst(),
+                                        config.getThrottleMaxRetries(), config.getThrottleBackoffBase(),
+                                        config.getThrottleBackoffMax(), self.metrics)
+            if self.response_cache is not None:
+                self.api = CachedClient(self.api, self.response_cache)
+            if self.record:
+                # Outermost, so responses served by the response cache are recorded too
+                self.api = Recorder(self.api, self.record)
+            # Outermost, so call latencies include rate limiting, retries and cache hits
+            self.api = Instrumented(self.api, self.metrics, "api")
         except ClientError as e:
             pc.printout('ClientError {0!s} (Code: {1:d}, Response: {2!s})'.format(e.msg, e.code, e.error_response), pc.RED)
             error = json.loads(e.error_response)
@@ -1146,18 +1096,27 @@ class Osintgram:
         if str(self.target_id) == str(self.api.user_id):
             return True
         try:
-            # Get the list of users you are following
-            following_dict = self.api.user_following(self.api.user_id)
-            # Check if target_id is in your following list
-            return int(self.target_id) in following_dict
+            # A single friendship lookup instead of paging through our own followings
+            relationship = self.api.user_friendship_v1(str(self.target_id))
+            return bool(relationship.following)
         except Exception as e:
             pc.printout(f"Error checking following status: {e}\n", pc.RED)
             return False
 
+    def __interactive__(self):
+        # Batch runs (-c, --script) and background jobs have nobody to answer prompts
+        return not self.cli_mode and jobs.current() is None
+
+    def __ask__(self, question, default):
+        if not self.__interactive__():
+            return default
+        pc.printout(question, pc.YELLOW)
+        return input()
+
     def check_private_profile(self):
         if self.is_private and not self.following:
             pc.printout("Impossible to execute command: user has private profile\n", pc.RED)
-            send = input("Do you want send a follow request? [Y/N]: ")
+            send = self.__ask__("Do you want send a follow request? [Y/N]: ", "n")
             if send.lower() == "y":
                 self.api.friendships_create(self.target_id)
                 print("Sent a follow request to target. Use this command after target accepting the request.")
@@ -1206,8 +1165,7 @@ class Osintgram:
 
             results = []
             
-            pc.printout("Do you want to get all emails? y/n: ", pc.YELLOW)
-            value = input()
+            value = self.__ask__("Do you want to get all emails? y/n: ", "y")
             
             if value == str("y") or value == str("yes") or value == str("Yes") or value == str("YES"):
                 value = len(followers)
@@ -1309,8 +1267,7 @@ class Osintgram:
         
             results = []
             
-            pc.printout("Do you want to get all emails? y/n: ", pc.YELLOW)
-            value = input()
+            value = self.__ask__("Do you want to get all emails? y/n: ", "y")
             
             if value == str("y") or value == str("yes") or value == str("Yes") or value == str("YES"):
                 value = len(followings)
@@ -1378,6 +1335,9 @@ class Osintgram:
             pc.printout("Sorry! No results found :-(\n", pc.RED)
 
     def clear_cache(self):
+        self.feed_cache.clear()
+        if self.response_cache is not None:
+            self.response_cache.purge()
         try:
             with open("config/settings.json", 'w') as f:
                 f.write("{}")
@@ -1385,33 +1345,11 @@ class Osintgram:
         except FileNotFoundError:
             pc.printout("Settings.json don't exist.\n", pc.RED)
 
-    def get_hashtags(self):
-        """
-        Example: Print hashtags used in the target's captions.
-        """
-        if self.check_private_profile():
-            return
-
-        pc.printout("Searching for hashtags in target's captions...\n")
-        data = self.__get_feed__()
-        hashtags = set()
-        for post in data:
-            if "caption" in post and post["caption"]:
-                text = post["caption"]["text"]
-                hashtags.update({tag.strip("#") for tag in text.split() if tag.startswith("#")})
-
-        if hashtags:
-            pc.printout("Found hashtags:\n", pc.GREEN)
-            for tag in hashtags:
-                print(f"#{tag}")
-        else:
-            pc.printout("No hashtags found.\n", pc.RED)
-
-    def get_user_info(self):
+    def get_user_info(self, profile):
         """
         Prints basic information about the target user.
         """
-        user = self.api.user_info_by_username(self.target)
+        user = profile
         info = {
             "id": user.pk,
             "username": user.username,
@@ -1425,36 +1363,3 @@ class Osintgram:
         }
         for k, v in info.items():
             print(f"{k}: {v}")
-
-    def get_total_likes(self):
-        if self.check_private_profile():
-            return
-
-        pc.printout("Searching for total likes on target's posts...\n")
-
-        total_likes = 0
-        posts = 0
-
-        data = self.__get_feed__()
-
-        for post in data:
-            if 'like_count' in post:
-                total_likes += post['like_count']
-                posts += 1
-
-        if self.writeFile:
-            file_name = self.output_dir + "/" + self.target + "_likes.txt"
-            with open(file_name, "w") as file:
-                file.write(f"{total_likes} likes in {posts} posts\n")
-
-        if self.jsonDump:
-            json_data = {
-                'like_counter': total_likes,
-                'posts': posts
-            }
-            json_file_name = self.output_dir + "/" + self.target + "_likes.json"
-            with open(json_file_name, 'w') as f:
-                json.dump(json_data, f)
-
-        pc.printout(f"{total_likes}", pc.MAGENTA)
-        pc.printout(f" likes in {posts} posts\n")
@@ -0,0 +1,40 @@
+import datetime
+
+
+def taken_at(post):
+    # Publication time of a post: instagrapi gives a UTC datetime, raw API items a unix timestamp
+    value = post.get('taken_at')
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromtimestamp(value or 0, datetime.timezone.utc)
+
+
+class UserCounter:
+    """
+    Counts occurrences per user, keyed by pk, in a single pass.
+
+    Each user is stored once as a compact [count, username, full_name] record
+    and top() ranks them by count.
+    """
+
+    def __init__(self):
+        self.records = {}
+
+    def add(self, user):
+        record = self.records.get(user['pk'])
+        if record is None:
+            self.records[user['pk']] = [1, user['username'], user['full_name']]
+        else:
+            record[0] += 1
+
+    def __len__(self):
+        return len(self.records)
+
+    def top(self):
+        ranked = sorted(self.records.items(), key=lambda item: item[1][0], reverse=True)
+        return [{
+            'id': pk,
+            'username': record[1],
+            'full_name': record[2],
+            'counter': record[0]
+        } for pk, record in ranked]
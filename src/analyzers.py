@@ -0,0 +1,409 @@
+import abc
+import json
+
+from src import printcolors as pc
+from src.aggregate import UserCounter, taken_at
+from src import registry
+from src.registry import register_analyzer
+
+
+def PrettyTable(*args, **kwargs):
+    # prettytable is only imported once a command actually renders a table
+    from prettytable import PrettyTable as Table
+    return Table(*args, **kwargs)
+
+
+def caption_text(post):
+    if post.get('caption_text'):
+        return post['caption_text']
+    caption = post.get('caption')
+    if isinstance(caption, dict):
+        return caption.get('text') or ""
+    return ""
+
+
+class Analyzer(abc.ABC):
+    """
+    Plugin interface for shell commands. Subclasses decorated with
+    src.registry.register_analyzer become commands named after name, listed
+    with help.
+
+    needs lists the data the analysis works on ('feed', 'comments', 'stories',
+    'profile'). Osintgram fetches it once, shares it through its session caches
+    and passes it to run() as a dict, so analyzers never call the API themselves.
+    """
+
+    name = None
+    help = ""
+    needs = ()
+
+    def __init__(self, osintgram):
+        self.osintgram = osintgram
+
+    @abc.abstractmethod
+    def run(self, inputs):
+        pass
+
+
+class FeedAnalyzer(Analyzer):
+    """
+    An analysis computed post by post over the target feed, so that several of
+    them can share a single pass over the posts.
+
+    add() is called once per post, result() returns a JSON serializable summary
+    and text() a printable one; the report uses them for its section. The command
+    itself calls output(), which prints text() and, with FILE=y / JSON=y, saves
+    it in <target>_<name>.txt / <target>_<name>.json. The built-in commands
+    override output() to keep the tables and files they always had.
+    """
+
+    needs = ('feed',)
+
+    def run(self, inputs):
+        for post in inputs['feed']:
+            self.add(post)
+        self.output()
+
+    def output(self):
+        text = self.text()
+        if not text:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        print(text)
+        self.save_text(text + "\n")
+        self.save_json({self.name: self.result()})
+
+    def save_text(self, text, name=None):
+        osintgram = self.osintgram
+        if osintgram.writeFile:
+            file_name = osintgram.output_dir + "/" + osintgram.target + "_" + (name or self.name) + ".txt"
+            with open(file_name, "w") as file:
+                file.write(text)
+
+    def save_json(self, json_data, name=None):
+        osintgram = self.osintgram
+        if osintgram.jsonDump:
+            json_file_name = osintgram.output_dir + "/" + osintgram.target + "_" + (name or self.name) + ".json"
+            with open(json_file_name, 'w') as f:
+                json.dump(json_data, f)
+
+    @abc.abstractmethod
+    def add(self, post):
+        pass
+
+    @abc.abstractmethod
+    def result(self):
+        pass
+
+    @abc.abstractmethod
+    def text(self):
+        pass
+
+
+@register_analyzer
+class AddressesAnalyzer(FeedAnalyzer):
+    name = "addrs"
+    help = "Get all registered addressed by target photos"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.locations = {}
+        self.addresses = None
+
+    def add(self, post):
+        location = post.get('location')
+        if location and location.get('lat') is not None and location.get('lng') is not None:
+            self.locations[(location['lat'], location['lng'])] = taken_at(post)
+
+    def result(self):
+        if self.addresses is None:
+            resolved = self.osintgram.geolocator.reverse_many(list(self.locations))
+            address = {}
+            for k, v in self.locations.items():
+                if resolved.get(k) is not None:
+                    address[resolved[k]] = v.strftime('%Y-%m-%d %H:%M:%S')
+            self.addresses = [{'address': a, 'time': t}
+                              for a, t in sorted(address.items(), key=lambda p: p[1], reverse=True)]
+        return self.addresses
+
+    def text(self):
+        return "\n".join(a['time'] + "  " + a['address'] for a in self.result())
+
+    def output(self):
+        addresses = self.result()
+        if not addresses:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        t = PrettyTable()
+        t.field_names = ['Post', 'Address', 'time']
+        t.align["Post"] = "l"
+        t.align["Address"] = "l"
+        for i, address in enumerate(addresses, 1):
+            t.add_row([str(i), address['address'], address['time']])
+        pc.printout("\nWoohoo! We found " + str(len(addresses)) + " addresses\n", pc.GREEN)
+        self.save_text(str(t))
+        self.save_json({'address': addresses})
+        print(t)
+
+
+@register_analyzer
+class CaptionsAnalyzer(FeedAnalyzer):
+    name = "captions"
+    help = "Get target's photos captions"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.captions = []
+
+    def add(self, post):
+        text = caption_text(post)
+        if text:
+            self.captions.append(text)
+
+    def result(self):
+        return self.captions
+
+    def text(self):
+        return "\n\n".join(self.captions)
+
+    def output(self):
+        if not self.captions:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        pc.printout("\nWoohoo! We found " + str(len(self.captions)) + " captions\n", pc.GREEN)
+        for caption in self.captions:
+            print(caption + "\n")
+        self.save_text("".join(caption + "\n" for caption in self.captions))
+        self.save_json({'captions': self.captions})
+
+
+@register_analyzer
+class CommentsAnalyzer(FeedAnalyzer):
+    name = "comments"
+    help = "Get total comments of target's posts"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.comments = 0
+        self.posts = 0
+
+    def add(self, post):
+        self.comments += post.get('comment_count') or 0
+        self.posts += 1
+
+    def result(self):
+        return {'comment_counter': self.comments, 'posts': self.posts}
+
+    def text(self):
+        return str(self.comments) + " comments in " + str(self.posts) + " posts"
+
+    def output(self):
+        self.save_text(self.text() + "\n")
+        self.save_json(self.result())
+        pc.printout(str(self.comments), pc.MAGENTA)
+        pc.printout(" comments in " + str(self.posts) + " posts\n")
+
+
+@register_analyzer
+class LikesAnalyzer(FeedAnalyzer):
+    name = "likes"
+    help = "Get total likes of target's posts"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.likes = 0
+        self.posts = 0
+
+    def add(self, post):
+        if 'like_count' in post:
+            self.likes += post['like_count'] or 0
+            self.posts += 1
+
+    def result(self):
+        return {'like_counter': self.likes, 'posts': self.posts}
+
+    def text(self):
+        return str(self.likes) + " likes in " + str(self.posts) + " posts"
+
+    def output(self):
+        self.save_text(self.text() + "\n")
+        self.save_json(self.result())
+        pc.printout(str(self.likes), pc.MAGENTA)
+        pc.printout(" likes in " + str(self.posts) + " posts\n")
+
+
+@register_analyzer
+class HashtagsAnalyzer(FeedAnalyzer):
+    name = "hashtags"
+    help = "Get hashtags used by target"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.hashtags = {}
+
+    def add(self, post):
+        for word in caption_text(post).split():
+            if word.startswith("#"):
+                tag = word.strip("#")
+                self.hashtags[tag] = self.hashtags.get(tag, 0) + 1
+
+    def result(self):
+        return dict(sorted(self.hashtags.items(), key=lambda p: p[1], reverse=True))
+
+    def text(self):
+        return "\n".join("#" + tag + " (" + str(n) + ")" for tag, n in self.result().items())
+
+
+@register_analyzer
+class MediaTypeAnalyzer(FeedAnalyzer):
+    name = "mediatype"
+    help = "Get target's posts type (photo or video)"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.photos = 0
+        self.videos = 0
+        self.posts = 0
+
+    def add(self, post):
+        if 'media_type' in post:
+            self.posts += 1
+        if post.get('media_type') == 1:
+            self.photos += 1
+        elif post.get('media_type') == 2:
+            self.videos += 1
+
+    def result(self):
+        return {'photos': self.photos, 'videos': self.videos}
+
+    def text(self):
+        return str(self.photos) + " photos and " + str(self.videos) + " video posted by target"
+
+    def output(self):
+        if not self.posts:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        self.save_text(self.text() + "\n")
+        pc.printout("\nWoohoo! We found " + self.text() + "\n", pc.GREEN)
+        self.save_json(self.result())
+
+
+@register_analyzer
+class PhotoDescriptionAnalyzer(FeedAnalyzer):
+    name = "photodes"
+    help = "Get description of target's photos"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.descriptions = []
+
+    def add(self, post):
+        if post.get('accessibility_caption'):
+            self.descriptions.append(post['accessibility_caption'])
+
+    def result(self):
+        return self.descriptions
+
+    def text(self):
+        return "\n".join(self.descriptions)
+
+    def output(self):
+        if not self.descriptions:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        pc.printout("\nWoohoo! We found " + str(len(self.descriptions)) + " descriptions\n", pc.GREEN)
+        t = PrettyTable(['Photo', 'Description'])
+        t.align["Photo"] = "l"
+        t.align["Description"] = "l"
+        for i, description in enumerate(self.descriptions, 1):
+            t.add_row([str(i), description])
+        self.save_text(str(t))
+        self.save_json({'descriptions': [{'description': d} for d in self.descriptions]}, "descriptions")
+        print(t)
+
+
+@register_analyzer
+class TaggedAnalyzer(FeedAnalyzer):
+    name = "tagged"
+    help = "Get list of users tagged by target"
+
+    def __init__(self, osintgram):
+        super().__init__(osintgram)
+        self.users = UserCounter()
+        self.tags = 0
+
+    def add(self, post):
+        tags = post.get('usertags') or []
+        if isinstance(tags, dict):
+            tags = tags.get('in') or []
+        for tag in tags:
+            if tag.get('user'):
+                self.users.add(tag['user'])
+                self.tags += 1
+
+    def result(self):
+        return self.users.top()
+
+    def text(self):
+        return "\n".join(str(u['counter']) + "  " + u['username'] + " (" + str(u['full_name']) + ")"
+                         for u in self.result())
+
+    def output(self):
+        users = self.result()
+        if not users:
+            pc.printout("Sorry! No results found :-(\n", pc.RED)
+            return
+        t = PrettyTable()
+        t.field_names = ['Posts', 'Full Name', 'Username', 'ID']
+        t.align["Posts"] = "l"
+        t.align["Full Name"] = "l"
+        t.align["Username"] = "l"
+        t.align["ID"] = "l"
+        pc.printout("\nWoohoo! We found " + str(len(users)) + " (" + str(self.tags) + ") users\n", pc.GREEN)
+        for u in users:
+            t.add_row([u['counter'], u['full_name'], u['username'], str(u['id'])])
+        self.save_text(str(t))
+        self.save_json({'tagged': [{'post': u['counter'], 'full_name': u['full_name'], 'username': u['username'],
+                                    'id': u['id']} for u in users]})
+        print(t)
+
+
+@register_analyzer
+class ReportAnalyzer(Analyzer):
+    name = "report"
+    help = "Run every post analysis in a single pass and build one combined report"
+    needs = ('feed',)
+
+    def run(self, inputs):
+        osintgram = self.osintgram
+        data = inputs['feed']
+        # Every registered FeedAnalyzer, plugins included, becomes a section
+        analyzers = [analyzer(osintgram) for analyzer in registry.analyzers(FeedAnalyzer)]
+
+        pc.printout("Building report on target posts...\n")
+
+        # Every analysis is fed in the same pass over the posts
+        for post in data:
+            for analyzer in analyzers:
+                analyzer.add(post)
+
+        json_data = {'target': osintgram.target, 'posts': len(data)}
+        sections = []
+        for analyzer in analyzers:
+            json_data[analyzer.name] = analyzer.result()
+            sections.append("[" + analyzer.name + "]\n" + (analyzer.text() or "No results found"))
+        text = "\n\n".join(sections) + "\n"
+
+        print(text)
+
+        if osintgram.writeFile:
+            file_name = osintgram.output_dir + "/" + osintgram.target + "_report.txt"
+            with open(file_name, "w") as file:
+                file.write(text)
+
+        if osintgram.jsonDump:
+            json_file_name = osintgram.output_dir + "/" + osintgram.target + "_report.json"
+            with open(json_file_name, 'w') as f:
+                json.dump(json_data, f)
+
+        pc.printout("Report covers " + str(len(data)) + " posts\n", pc.GREEN)
@@ -0,0 +1,139 @@
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class MemoryCache:
+    """
+    Session-scoped in-memory cache with a per-entry time to live.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self.entries = {}
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def lock(self, key):
+        # Held by commands updating an entry in place, so background jobs don't interleave
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            del self.entries[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.time(), value)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+MISS = object()
+
+
+def call_key(name, args, kwargs):
+    return name + repr(args) + repr(sorted(kwargs.items()))
+
+
+class DiskCache:
+    """
+    SQLite backed response cache that survives between runs.
+
+    Every endpoint has its own time to live; once the stored payloads grow
+    past max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, ttls, max_bytes):
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                        "key TEXT PRIMARY KEY, endpoint TEXT, value BLOB, size INTEGER, "
+                        "stored_at REAL, accessed_at REAL)")
+        self.db.commit()
+
+    def get(self, endpoint, key):
+        with self.lock:
+            row = self.db.execute("SELECT value, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return MISS
+            now = time.time()
+            if now - row[1] > self.ttls.get(endpoint, 0):
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return MISS
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return pickle.loads(row[0])
+
+    def set(self, endpoint, key, value):
+        try:
+            blob = pickle.dumps(value)
+        except Exception:
+            return
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, endpoint, blob, len(blob), now, now))
+            self.__evict__()
+            self.db.commit()
+
+    def __evict__(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def purge(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+            self.db.execute("VACUUM")
+
+
+class CachedClient:
+    """
+    Wraps the instagrapi client and serves the cached endpoints from a DiskCache.
+    Every other attribute is passed through untouched.
+    """
+
+    def __init__(self, api, cache):
+        self.api = api
+        self.cache = cache
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if name not in self.cache.ttls or not callable(attr):
+            return attr
+
+        def cached_call(*args, **kwargs):
+            key = call_key(name, args, kwargs)
+            value = self.cache.get(name, key)
+            if value is MISS:
+                value = attr(*args, **kwargs)
+                self.cache.set(name, key, value)
+            return value
+
+        return cached_call
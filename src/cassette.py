@@ -0,0 +1,123 @@
+import gzip
+import pickle
+import threading
+import time
+
+from instagrapi.exceptions import ClientThrottledError, PleaseWaitFewMinutes
+
+from src.cache import call_key
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+class Recorder:
+    """
+    Wraps the instagrapi client and appends every call made through it, with
+    its arguments, response (or error) and duration, to a gzip cassette.
+
+    Records are written one by one and flushed, so an interrupted session
+    still leaves a usable cassette. Throttling errors are not recorded, the
+    retried call is.
+    """
+
+    # Client attributes read by Osintgram, saved in the cassette header
+    attrs = ('user_id', 'username')
+
+    def __init__(self, api, path):
+        self.api = api
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "wb")
+        self.__write__({'attrs': {name: getattr(api, name, None) for name in self.attrs}})
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def recorded_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                value = attr(*args, **kwargs)
+            except (ClientThrottledError, PleaseWaitFewMinutes):
+                raise
+            except Exception as e:
+                self.__record__(name, args, kwargs, 'error', e, started)
+                raise
+            self.__record__(name, args, kwargs, 'ok', value, started)
+            return value
+
+        return recorded_call
+
+    def __record__(self, name, args, kwargs, status, value, started):
+        try:
+            blob = pickle.dumps(value)
+        except Exception:
+            return
+        self.__write__((name, call_key(name, args, kwargs), status, blob, time.perf_counter() - started))
+
+    def __write__(self, record):
+        with self.lock:
+            pickle.dump(record, self.file)
+            self.file.flush()
+
+
+def read_cassette(path):
+    records = []
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                # End of the cassette, or the last record of an interrupted session
+                break
+    return records
+
+
+class ReplayClient:
+    """
+    Stands in for the instagrapi client, serving the responses of a cassette
+    written by Recorder. No login or network access is needed.
+
+    A call repeated with the same arguments gets the recorded responses in
+    order, then the last one again. latency adds a fixed delay in seconds to
+    every call, or replays the recorded durations when set to "recorded".
+    """
+
+    thread_safe = True
+
+    def __init__(self, path, latency=None):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.position = {}
+        records = read_cassette(path)
+        for name, value in records[0]['attrs'].items():
+            setattr(self, name, value)
+        for name, key, status, blob, seconds in records[1:]:
+            self.responses.setdefault(key, []).append((status, blob, seconds))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def replayed_call(*args, **kwargs):
+            key = call_key(name, args, kwargs)
+            with self.lock:
+                responses = self.responses.get(key)
+                if not responses:
+                    raise CassetteMiss("no recorded response for " + key)
+                position = self.position.get(key, 0)
+                self.position[key] = position + 1
+            status, blob, seconds = responses[min(position, len(responses) - 1)]
+            if self.latency == "recorded":
+                time.sleep(seconds)
+            elif self.latency:
+                time.sleep(self.latency)
+            value = pickle.loads(blob)
+            if status == 'error':
+                raise value
+            return value
+
+        return replayed_call
@@ -0,0 +1,71 @@
+import json
+import os
+
+
+class Checkpoint:
+    """
+    Keeps the pagination cursor of a long listing and the rows fetched so far
+    next to the command output, so an interrupted run can pick up where it stopped.
+
+    Rows are appended to <base>.checkpoint.ndjson page by page; <base>.checkpoint.json
+    holds the cursor together with the size of the rows file it matches.
+    """
+
+    def __init__(self, base_name):
+        self.state_file = base_name + ".checkpoint.json"
+        self.rows_file = base_name + ".checkpoint.ndjson"
+        self.file = None
+
+    def load(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        # Drop rows written after the last saved cursor, they will be fetched again
+        mode = "w"
+        if state is not None and os.path.isfile(self.rows_file):
+            with open(self.rows_file, "r+") as f:
+                f.truncate(state['rows_offset'])
+            mode = "a"
+        else:
+            state = None
+        self.file = open(self.rows_file, mode)
+        return state
+
+    def rows(self):
+        self.file.flush()
+        with open(self.rows_file) as f:
+            for line in f:
+                yield json.loads(line)
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, default=self.__serialize__) + "\n")
+
+    def save(self, **state):
+        self.file.flush()
+        state['rows_offset'] = self.file.tell()
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def clear(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for file_name in (self.state_file, self.rows_file):
+            if os.path.isfile(file_name):
+                os.remove(file_name)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def __serialize__(value):
+        if hasattr(value, 'dict'):
+            return value.dict()
+        return str(value)
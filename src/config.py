@@ -11,3 +11,125 @@ def getUsername():
 def getPassword():
     return PASSWORD
 
+# Seconds a fetched target feed is reused by the analysis commands
+FEED_CACHE_TTL = 600
+
+def getFeedCacheTtl():
+    return FEED_CACHE_TTL
+
+# Default number of latest posts analysed by the feed based commands
+FEED_DEPTH = 100
+
+def getFeedDepth():
+    return FEED_DEPTH
+
+# Posts requested per feed page (the most the endpoint returns at once)
+FEED_PAGE_SIZE = 33
+
+def getFeedPageSize():
+    return FEED_PAGE_SIZE
+
+# On-disk cache of Instagram responses, shared between runs
+RESPONSE_CACHE_FILE = "config/cache.db"
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_TTLS = {
+    'user_info_by_username': 24 * 3600,
+    'user_medias': 3600,
+    'user_medias_paginated': 3600,
+    'media_comments': 3600,
+    'user_reel_media': 300,
+}
+
+def getResponseCacheFile():
+    return RESPONSE_CACHE_FILE
+
+def getResponseCacheMaxBytes():
+    return RESPONSE_CACHE_MAX_BYTES
+
+def getResponseCacheTtls():
+    return RESPONSE_CACHE_TTLS
+
+# Reverse geocoding used by the addrs command. GEOCODER_BACKEND is "nominatim"
+# or "offline"; the offline backend reads a local CSV of places (lat, lon, name,
+# admin1, admin2, cc columns, e.g. a GeoNames cities export) from GEOCODER_DATASET.
+GEOCODER_BACKEND = "nominatim"
+GEOCODER_DATASET = "config/rg_cities1000.csv"
+GEOCODE_PRECISION = 4
+GEOCODE_CACHE_FILE = "config/geocode.db"
+GEOCODE_CACHE_TTL = 90 * 24 * 3600
+GEOCODE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+def getGeocoderBackend():
+    return GEOCODER_BACKEND
+
+def getGeocoderDataset():
+    return GEOCODER_DATASET
+
+def getGeocodePrecision():
+    return GEOCODE_PRECISION
+
+def getGeocodeCacheFile():
+    return GEOCODE_CACHE_FILE
+
+def getGeocodeCacheTtl():
+    return GEOCODE_CACHE_TTL
+
+def getGeocodeCacheMaxBytes():
+    return GEOCODE_CACHE_MAX_BYTES
+
+# Request scheduling for the Instagram client: sustained requests per second,
+# burst size, and how throttling errors are retried
+REQUESTS_PER_SECOND = 1.0
+REQUESTS_BURST = 5
+THROTTLE_MAX_RETRIES = 5
+THROTTLE_BACKOFF_BASE = 15
+THROTTLE_BACKOFF_MAX = 600
+
+def getRequestsPerSecond():
+    return REQUESTS_PER_SECOND
+
+def getRequestsBurst():
+    return REQUESTS_BURST
+
+def getThrottleMaxRetries():
+    return THROTTLE_MAX_RETRIES
+
+def getThrottleBackoffBase():
+    return THROTTLE_BACKOFF_BASE
+
+def getThrottleBackoffMax():
+    return THROTTLE_BACKOFF_MAX
+
+# Media downloads (photos, stories, propic)
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = 30
+
+def getDownloadWorkers():
+    return DOWNLOAD_WORKERS
+
+def getDownloadRetries():
+    return DOWNLOAD_RETRIES
+
+def getDownloadTimeout():
+    return DOWNLOAD_TIMEOUT
+
+# Number of requests to Instagram issued at the same time over the logged-in session,
+# e.g. comment threads of several posts (commentdata, wcommented).
+# Requests still share the REQUESTS_PER_SECOND budget.
+API_WORKERS = 4
+
+def getApiWorkers():
+    return API_WORKERS
+
+# Number of allocation sites listed in the memory report of --trace-memory
+PROFILE_TOP = 25
+
+def getProfileTop():
+    return PROFILE_TOP
+
+# Extra modules registering commands with src.registry (e.g. "plugins.my_analysis")
+PLUGINS = []
+
+def getPlugins():
+    return PLUGINS
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import jobs
+from src import profiling
+from src.scheduler import parse_retry_after
+
+
+class IncompleteDownload(IOError):
+    pass
+
+
+class Downloader:
+    """
+    Bounded thread-pool media downloader. Connections are kept alive and reused
+    through one requests session; failed files are retried with a short backoff.
+
+    Every command queues its files on its own batch(): Batch.submit() queues a
+    file and Batch.wait() blocks until the files of that batch are done, so
+    commands downloading at the same time (e.g. a background job) never wait
+    for or count each other's files. The optional callback of a file is called
+    once it has been saved.
+
+    Data is streamed to <file>.part and only renamed to <file> once its size matches
+    Content-Length, so a file on disk is always complete. An existing .part file is
+    resumed with an HTTP Range request. Throttled requests wait for Retry-After
+    when the server sends one; other 4xx answers fail without retrying.
+
+    With base_url set, media URLs keep their path but are fetched from that host
+    instead, e.g. the local mock CDN of src.mockcdn.
+    """
+
+    def __init__(self, workers=8, retries=3, timeout=30, metrics=None, base_url=None):
+        self.retries = retries
+        self.base_url = base_url
+        self.metrics = metrics
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def batch(self):
+        return Batch(self)
+
+    def __submit__(self, url, path, callback, batch):
+        jobs.check_cancelled()
+        url = str(url)
+        if self.base_url:
+            url = self.base_url.rstrip("/") + urllib.parse.urlsplit(url).path
+        return self.executor.submit(profiling.propagate(jobs.propagate(self.__download__)), url, path, callback,
+                                    batch)
+
+    def __download__(self, url, path, callback, batch):
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self.__fetch__(url, path)
+                break
+            except (requests.RequestException, OSError) as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                # 4xx answers other than 429 won't change by asking again
+                if attempt == self.retries or (status is not None and 400 <= status < 500 and status != 429):
+                    self.__record__(started, True)
+                    batch.__done__(False)
+                    return False
+                if self.metrics is not None:
+                    self.metrics.event('download_retries')
+                delay = parse_retry_after(getattr(getattr(e, 'response', None), 'headers', None))
+                time.sleep(2 ** attempt if delay is None else delay)
+
+        self.__record__(started, False)
+
+        if callback is not None:
+            callback()
+        batch.__done__(True)
+        return True
+
+    def __fetch__(self, url, path):
+        part = path + ".part"
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        headers = {'Range': 'bytes=%i-' % offset} if offset else {}
+
+        with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+            if response.status_code == 416:
+                # The partial file does not match the remote one anymore, start over
+                os.remove(part)
+                raise IncompleteDownload("range not satisfiable for " + url)
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+
+            expected = None
+            if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+                expected = offset + int(response.headers['Content-Length'])
+
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                    if self.metrics is not None:
+                        self.metrics.add_bytes('download', len(chunk))
+
+        size = os.path.getsize(part)
+        if expected is not None and size != expected:
+            raise IncompleteDownload("got %i of %i bytes for %s" % (size, expected, url))
+        os.replace(part, path)
+
+    def __record__(self, started, failed):
+        if self.metrics is not None:
+            self.metrics.record('download', 'media', time.perf_counter() - started, failed)
+
+
+class Batch:
+    # Files queued by one command on a shared Downloader
+    def __init__(self, downloader):
+        self.downloader = downloader
+        self.lock = threading.Lock()
+        self.futures = []
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, url, path, callback=None):
+        future = self.downloader.__submit__(url, path, callback, self)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        for future in list(self.futures):
+            future.result()
+        return self.completed, self.failed
+
+    def __done__(self, completed):
+        with self.lock:
+            if completed:
+                self.completed += 1
+            else:
+                self.failed += 1
+            sys.stdout.write("\rDownloaded %i/%i" % (self.completed, len(self.futures)))
+            if self.failed:
+                sys.stdout.write(" (%i failed)" % self.failed)
+            sys.stdout.flush()
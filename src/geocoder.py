@@ -0,0 +1,140 @@
+import csv
+import math
+
+from src import jobs
+from src import printcolors as pc
+from src.cache import MISS
+from src.scheduler import TokenBucket
+
+
+class GeocoderUnavailable(Exception):
+    """
+    A lookup failed for a reason that may not last (network, rate limit, service
+    down): the point stays unresolved and is not cached.
+    """
+
+
+class NominatimBackend:
+    name = "nominatim"
+    remote = True
+
+    def __init__(self, user_agent="http"):
+        self.user_agent = user_agent
+        self.geolocator = None
+
+    def reverse(self, lat, lng):
+        if self.geolocator is None:
+            # geopy is only imported when an address is actually looked up
+            from geopy.geocoders import Nominatim
+            self.geolocator = Nominatim(user_agent=self.user_agent)
+        from geopy.exc import GeopyError
+        from requests import RequestException
+        try:
+            details = self.geolocator.reverse(str(lat) + ', ' + str(lng))
+        except (GeopyError, RequestException, OSError) as e:
+            raise GeocoderUnavailable(e)
+        if details is None:
+            return None
+        return details.address
+
+
+class OfflineBackend:
+    """
+    Resolves coordinates against a local CSV of places with lat, lon and name
+    columns (optionally admin2, admin1 and cc, as in the GeoNames cities files).
+    """
+
+    name = "offline"
+    remote = False
+
+    def __init__(self, dataset, max_radius=20):
+        self.dataset = dataset
+        # Furthest ring of 1 degree cells searched, places further away are not matched
+        self.max_radius = max_radius
+        self.cells = None
+
+    def load(self):
+        self.cells = {}
+        with open(self.dataset, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                lat = float(row['lat'])
+                lng = float(row['lon'])
+                parts = [row.get(k) for k in ('name', 'admin2', 'admin1', 'cc')]
+                address = ", ".join(p for p in parts if p)
+                self.cells.setdefault((math.floor(lat), math.floor(lng)), []).append((lat, lng, address))
+
+    def reverse(self, lat, lng):
+        if self.cells is None:
+            self.load()
+        if not self.cells:
+            return None
+        cell_lat, cell_lng = math.floor(lat), math.floor(lng)
+        scale = math.cos(math.radians(lat))
+        best = None
+        # Widen the search ring by ring. A place in ring r is at least r - 1 cells
+        # away, so once that bound passes the best distance no nearer place is left.
+        for radius in range(0, self.max_radius + 1):
+            if best is not None and ((radius - 1) * scale) ** 2 >= best[0]:
+                break
+            for i in range(cell_lat - radius, cell_lat + radius + 1):
+                for j in range(cell_lng - radius, cell_lng + radius + 1):
+                    if max(abs(i - cell_lat), abs(j - cell_lng)) != radius:
+                        continue
+                    for place in self.cells.get((i, (j + 180) % 360 - 180), []):
+                        d = (place[0] - lat) ** 2 + ((place[1] - lng) * scale) ** 2
+                        if best is None or d < best[0]:
+                            best = (d, place[2])
+        if best is None:
+            return None
+        return best[1]
+
+
+class Geocoder:
+    """
+    Reverse geocoder with a persistent cache keyed by rounded coordinates.
+
+    Points that round to the same key are resolved once, and lookups against
+    a remote backend are limited to rate requests per second.
+    """
+
+    def __init__(self, backend, cache=None, precision=4, rate=1.0):
+        self.backend = backend
+        self.cache = cache
+        self.precision = precision
+        self.bucket = TokenBucket(rate)
+
+    def __key__(self, lat, lng):
+        return (round(float(lat), self.precision), round(float(lng), self.precision))
+
+    def __lookup__(self, lat, lng):
+        if self.backend.remote:
+            jobs.check_cancelled()
+            self.bucket.acquire()
+        return self.backend.reverse(lat, lng)
+
+    def reverse(self, lat, lng):
+        return self.reverse_many([(lat, lng)]).get((lat, lng))
+
+    def reverse_many(self, points):
+        keys = {}
+        for lat, lng in points:
+            keys.setdefault(self.__key__(lat, lng), []).append((lat, lng))
+
+        addresses = {}
+        for key, originals in keys.items():
+            cache_key = "geocode:%s:%s,%s" % (self.backend.name, key[0], key[1])
+            address = MISS
+            if self.cache is not None:
+                address = self.cache.get('geocode', cache_key)
+            if address is MISS:
+                try:
+                    address = self.__lookup__(key[0], key[1])
+                except GeocoderUnavailable as e:
+                    pc.printout("Can't resolve %s, %s: %s\n" % (key[0], key[1], e), pc.RED)
+                    address = None
+                else:
+                    if self.cache is not None:
+                        self.cache.set('geocode', cache_key, address)
+            for point in originals:
+                addresses[point] = address
+        return addresses
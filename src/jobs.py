@@ -0,0 +1,236 @@
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+
+from src import printcolors as pc
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job once it has been cancelled. It derives from BaseException
+    so that the broad except clauses of the commands don't swallow it.
+    """
+
+
+class JobOutput:
+    """
+    Spools the output of a job to a file, so long crawls don't hold it in memory.
+    Only the last line is kept, for the progress shown by 'jobs'.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file = open(file_name, 'w')
+        self.lock = threading.Lock()
+        self.line = ""
+        self.last = ""
+
+    def write(self, text):
+        with self.lock:
+            if self.file.closed:
+                return 0
+            self.file.write(text)
+            # Progress counters rewrite their line with \r
+            lines = text.replace("\r", "\n").split("\n")
+            self.line += lines[0]
+            if len(lines) > 1:
+                for line in [self.line] + lines[1:-1]:
+                    if line.strip():
+                        self.last = line.strip()
+                self.line = lines[-1]
+        return len(text)
+
+    def last_line(self):
+        return self.line.strip() or self.last
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Job:
+    def __init__(self, id, name, fn, output_dir):
+        self.id = id
+        self.name = name
+        self.fn = fn
+        self.status = "running"
+        self.output = JobOutput(os.path.join(output_dir, "job_%i.log" % id))
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.reported = False
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.__run__, daemon=True)
+
+    def __run__(self):
+        threads[threading.get_ident()] = self
+        try:
+            self.fn()
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except SystemExit:
+            self.status = "failed"
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
+        finally:
+            self.finished = time.time()
+            threads.pop(threading.get_ident(), None)
+            self.output.close()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def progress(self):
+        return self.output.last_line()
+
+
+class ThreadOutput:
+    """
+    Stands in for sys.stdout / sys.stdin. Threads running a job write to the job
+    log and read empty answers, so prompts fall back to their defaults; every
+    other thread keeps using the terminal, including readline in input().
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        job = threads.get(threading.get_ident())
+        if job is not None:
+            return job.output.write(text)
+        return self.stream.write(text)
+
+    def readline(self, *args):
+        if threading.get_ident() in threads:
+            return "\n"
+        return self.stream.readline(*args)
+
+    def fileno(self):
+        if threading.get_ident() in threads:
+            raise io.UnsupportedOperation("fileno")
+        return self.stream.fileno()
+
+    def flush(self):
+        if threading.get_ident() not in threads:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+jobs = {}
+threads = {}
+next_id = 1
+
+
+def start(name, fn, output_dir):
+    global next_id
+    if not isinstance(sys.stdout, ThreadOutput):
+        sys.stdout = ThreadOutput(sys.stdout)
+        sys.stdin = ThreadOutput(sys.stdin)
+    job = Job(next_id, name, fn, output_dir)
+    jobs[job.id] = job
+    next_id += 1
+    job.thread.start()
+    return job
+
+
+def running():
+    return [job for job in jobs.values() if job.status == "running"]
+
+
+def current():
+    return threads.get(threading.get_ident())
+
+
+def check_cancelled():
+    job = current()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled()
+
+
+def propagate(fn):
+    """
+    Wraps fn so that, when run on a worker thread, it counts as part of the job
+    that created it: output lands in the job log and cancellation reaches it.
+    """
+    job = current()
+    if job is None:
+        return fn
+
+    def run_in_job(*args, **kwargs):
+        ident = threading.get_ident()
+        threads[ident] = job
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            threads.pop(ident, None)
+
+    return run_in_job
+
+
+def print_jobs():
+    if not jobs:
+        pc.printout("No jobs\n", pc.YELLOW)
+        return
+    for job in jobs.values():
+        pc.printout("[%i] " % job.id, pc.CYAN)
+        pc.printout("%-10s %6is  %s" % (job.status, job.elapsed(), job.name))
+        progress = job.progress()
+        if job.status == "running" and progress:
+            pc.printout("  (" + progress + ")", pc.YELLOW)
+        print("")
+
+
+def wait(id):
+    job = find(id)
+    if job is None:
+        return
+    while job.thread.is_alive():
+        job.thread.join(0.2)
+    with open(job.output.file_name) as f:
+        shutil.copyfileobj(f, sys.stdout)
+    print("")
+    report(job)
+
+
+def cancel(id):
+    job = find(id)
+    if job is None:
+        return
+    if job.status != "running":
+        pc.printout("Job " + str(job.id) + " is already " + job.status + "\n", pc.YELLOW)
+        return
+    job.cancelled.set()
+    pc.printout("Cancelling job " + str(job.id) + ", it stops at its next request\n", pc.YELLOW)
+
+
+def find(id):
+    try:
+        job = jobs.get(int(id))
+    except ValueError:
+        job = None
+    if job is None:
+        pc.printout("Unknown job " + str(id) + "\n", pc.RED)
+    return job
+
+
+def report(job):
+    job.reported = True
+    colour = pc.GREEN if job.status == "done" else pc.RED
+    pc.printout("[%i] %s %s (%.1fs)" % (job.id, job.status, job.name, job.elapsed()), colour)
+    if job.error is not None:
+        pc.printout(": " + str(job.error), colour)
+    print("")
+
+
+def report_finished():
+    # Announces jobs that ended since the last prompt; 'wait <id>' shows their output
+    for job in jobs.values():
+        if job.status != "running" and not job.reported:
+            report(job)
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class Manifest:
+    """
+    Index of the media already downloaded in an output folder, with size and
+    sha256 of every file. Files found on disk but missing from the manifest are
+    indexed on load, so folders synced before the manifest existed are reused.
+
+    complete is set once a sync went through the whole feed; later syncs can then
+    stop paging as soon as they reach media they already have.
+    """
+
+    media_extensions = ('.jpg', '.mp4')
+
+    def __init__(self, directory, file_name):
+        self.directory = directory
+        self.file_name = os.path.join(directory, file_name)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.complete = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.file_name) as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+            self.complete = data.get('complete', False)
+        except (OSError, ValueError):
+            pass
+
+        for name in os.listdir(self.directory):
+            if name.endswith(self.media_extensions) and name not in self.files:
+                self.add(name)
+
+    def has(self, name):
+        entry = self.files.get(name)
+        if entry is None:
+            return False
+        try:
+            return os.path.getsize(os.path.join(self.directory, name)) == entry['size']
+        except OSError:
+            return False
+
+    def add(self, name):
+        path = os.path.join(self.directory, name)
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        with self.lock:
+            self.files[name] = {'size': os.path.getsize(path), 'sha256': sha256.hexdigest()}
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.file_name + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'complete': self.complete, 'files': self.files}, f)
+            os.replace(tmp_file, self.file_name)
@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+
+from src import jobs
+from src import printcolors as pc
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))]
+
+
+class Metrics:
+    """
+    Collects what a command spends its time on: calls and latencies per
+    endpoint (grouped by source: api, geocoder, download), errors, retry and
+    throttle events, and bytes transferred.
+
+    reset() starts a new command; report() returns its figures as a dict.
+    The foreground and every background job of src.jobs (worker threads
+    included) have a run of their own, so a job and a foreground command
+    never reset or report each other's figures.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = {}
+        self.reset()
+
+    def reset(self, command=None):
+        with self.lock:
+            self.runs[jobs.current()] = Run(command)
+
+    def __run__(self):
+        # Run of the calling thread's job, None being the foreground
+        job = jobs.current()
+        if job not in self.runs:
+            self.runs[job] = Run(None)
+        return self.runs[job]
+
+    def record(self, source, endpoint, seconds, error=False):
+        with self.lock:
+            run = self.__run__()
+            run.latencies.setdefault((source, endpoint), []).append(seconds)
+            if error:
+                run.errors[(source, endpoint)] = run.errors.get((source, endpoint), 0) + 1
+
+    def event(self, name, n=1):
+        with self.lock:
+            run = self.__run__()
+            run.events[name] = run.events.get(name, 0) + n
+
+    def add_bytes(self, source, n):
+        with self.lock:
+            run = self.__run__()
+            run.bytes[source] = run.bytes.get(source, 0) + n
+
+    def report(self):
+        with self.lock:
+            run = self.__run__()
+            endpoints = []
+            for (source, endpoint), latencies in sorted(run.latencies.items()):
+                values = sorted(latencies)
+                endpoints.append({
+                    'source': source,
+                    'endpoint': endpoint,
+                    'calls': len(values),
+                    'errors': run.errors.get((source, endpoint), 0),
+                    'seconds': sum(values),
+                    'p50': percentile(values, 50),
+                    'p90': percentile(values, 90),
+                    'p99': percentile(values, 99),
+                    'max': values[-1],
+                })
+            return {
+                'command': run.command,
+                'seconds': time.perf_counter() - run.started,
+                'endpoints': endpoints,
+                'events': dict(run.events),
+                'bytes': dict(run.bytes),
+            }
+
+
+class Run:
+    # Figures of one command
+    def __init__(self, command):
+        self.command = command
+        self.started = time.perf_counter()
+        self.latencies = {}
+        self.errors = {}
+        self.events = {}
+        self.bytes = {}
+
+
+class Instrumented:
+    """
+    Wraps an object (the instagrapi client, a geocoder backend) and records the
+    latency of every method call in a Metrics under source.
+    """
+
+    def __init__(self, target, metrics, source):
+        self.target = target
+        self.metrics = metrics
+        self.source = source
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            error = True
+            try:
+                result = attr(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self.metrics.record(self.source, name, time.perf_counter() - started, error)
+
+        return timed_call
+
+
+def print_summary(report):
+    pc.printout("\nStats for " + str(report['command']) + " (%.2fs)\n" % report['seconds'], pc.CYAN)
+    waited = 0.0
+    if report['endpoints']:
+        print("%-32s %6s %6s %9s %9s %9s %9s %9s" % ("endpoint", "calls", "errors", "total s", "p50 ms", "p90 ms",
+                                                      "p99 ms", "max ms"))
+    for e in report['endpoints']:
+        print("%-32s %6i %6i %9.2f %9.1f %9.1f %9.1f %9.1f" % (
+            e['source'] + "." + e['endpoint'], e['calls'], e['errors'], e['seconds'], e['p50'] * 1000,
+            e['p90'] * 1000, e['p99'] * 1000, e['max'] * 1000))
+        # Downloads run in parallel with the command, only blocking calls count against its time
+        if e['source'] != "download":
+            waited += e['seconds']
+    print("%-32s %6s %6s %9.2f" % ("other (processing, output)", "", "", max(0.0, report['seconds'] - waited)))
+    if report['events']:
+        print("events: " + ", ".join("%s=%s" % (k, round(v, 2)) for k, v in sorted(report['events'].items())))
+    if report['bytes']:
+        print("bytes: " + ", ".join("%s=%i" % item for item in sorted(report['bytes'].items())))
+
+
+def write_json(reports, file_name):
+    with open(file_name, "w") as f:
+        json.dump(reports, f, indent=1)
+
+
+def write_prometheus(report, file_name):
+    """
+    Writes the figures of a command in the Prometheus text format, e.g. for the
+    node_exporter textfile collector. The file is replaced atomically.
+    """
+    command = report['command']
+    lines = [
+        "# TYPE osintgram_command_seconds gauge",
+        'osintgram_command_seconds{command="%s"} %f' % (command, report['seconds']),
+        "# TYPE osintgram_calls_total counter",
+    ]
+    for e in report['endpoints']:
+        lines.append('osintgram_calls_total{command="%s",source="%s",endpoint="%s"} %i'
+                     % (command, e['source'], e['endpoint'], e['calls']))
+    lines.append("# TYPE osintgram_call_errors_total counter")
+    for e in report['endpoints']:
+        lines.append('osintgram_call_errors_total{command="%s",source="%s",endpoint="%s"} %i'
+                     % (command, e['source'], e['endpoint'], e['errors']))
+    lines.append("# TYPE osintgram_call_latency_seconds summary")
+    for e in report['endpoints']:
+        labels = 'command="%s",source="%s",endpoint="%s"' % (command, e['source'], e['endpoint'])
+        for q in ("p50", "p90", "p99"):
+            lines.append('osintgram_call_latency_seconds{%s,quantile="0.%s"} %f' % (labels, q[1:], e[q]))
+        lines.append('osintgram_call_latency_seconds_sum{%s} %f' % (labels, e['seconds']))
+        lines.append('osintgram_call_latency_seconds_count{%s} %i' % (labels, e['calls']))
+    lines.append("# TYPE osintgram_events_total counter")
+    for name, value in sorted(report['events'].items()):
+        lines.append('osintgram_events_total{command="%s",event="%s"} %s' % (command, name, value))
+    lines.append("# TYPE osintgram_bytes_total counter")
+    for source, value in sorted(report['bytes'].items()):
+        lines.append('osintgram_bytes_total{command="%s",source="%s"} %i' % (command, source, value))
+
+    with open(file_name + ".tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(file_name + ".tmp", file_name)
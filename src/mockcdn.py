@@ -0,0 +1,193 @@
+"""
+Local stand-in for the Instagram CDN, to load-test media downloads.
+
+Every path serves a synthetic payload (deterministic for the path, so resumed
+downloads stay consistent) with Range support. Latency, bandwidth, throttling
+(429 with Retry-After) and mid-stream connection drops can be injected:
+
+    python -m src.mockcdn --port 8770 --size 200000 --latency 0.05 --throttle-rate 0.05 --drop-rate 0.1
+
+Point Osintgram at it with --mock-cdn http://127.0.0.1:8770 and photos, stories
+and propic download from it instead of the real CDN.
+"""
+import argparse
+import hashlib
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK = 64 * 1024
+
+
+class MockCDNHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        is_video = url.path.endswith(".mp4")
+        size = int(query['size'][0]) if 'size' in query else (server.video_size if is_video else server.size)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.chance(server.throttle_rate):
+            server.count('throttled')
+            body = b'{"message": "Please wait a few minutes before you try again.", "status": "fail"}'
+            self.send_response(429)
+            self.send_header("Retry-After", str(server.retry_after))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if start >= size:
+                server.count('unsatisfiable')
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%i" % size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %i-%i/%i" % (start, size - 1, size))
+            server.count('resumed')
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4" if is_video else "image/jpeg")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        # A dropped response stops somewhere in the body and closes the connection
+        end = size
+        if server.chance(server.drop_rate):
+            end = start + server.random_offset(size - start)
+            server.count('dropped')
+
+        payload = server.payload(url.path)
+        offset = start
+        while offset < end:
+            n = min(CHUNK, end - offset)
+            self.wfile.write(slice_payload(payload, offset, n))
+            offset += n
+            server.count('bytes', n)
+            if server.bandwidth:
+                time.sleep(n / server.bandwidth)
+
+        if end < size:
+            self.close_connection = True
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        server.count('served')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def slice_payload(payload, offset, n):
+    # The payload block repeats over the whole file
+    offset %= len(payload)
+    data = payload[offset:offset + n]
+    while len(data) < n:
+        data += payload[:n - len(data)]
+    return data
+
+
+class MockCDN(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, size=150000, video_size=2000000, latency=0.0, bandwidth=0, throttle_rate=0.0,
+                 drop_rate=0.0, retry_after=1, seed=None, verbose=False):
+        super().__init__(address, MockCDNHandler)
+        self.size = size
+        self.video_size = video_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.payloads = {}
+
+    def chance(self, rate):
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    def random_offset(self, length):
+        with self.lock:
+            return self.random.randrange(max(1, length))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def payload(self, path):
+        with self.lock:
+            payload = self.payloads.get(path)
+            if payload is None:
+                block = hashlib.sha256(path.encode()).digest()
+                payload = self.payloads[path] = block * (CHUNK // len(block))
+            return payload
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a response (or dropped connections) are part of the test
+        if self.verbose:
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return "http://%s:%i" % self.server_address[:2]
+
+
+def start(host="127.0.0.1", port=0, **options):
+    # Serves from a daemon thread, e.g. for benchmarks; port 0 picks a free port
+    server = MockCDN((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Instagram CDN serving synthetic media for download tests')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8770)
+    parser.add_argument('--size', type=int, default=150000, help='bytes of every image (or ?size=<n> per request)')
+    parser.add_argument('--video-size', type=int, default=2000000, help='bytes of every .mp4 file')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second per connection (0 unlimited)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of responses dropped mid-stream')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429')
+    parser.add_argument('--seed', type=int, help='random seed, to replay the same failures')
+    parser.add_argument('-v', '--verbose', help='log every request', action='store_true')
+    args = parser.parse_args()
+
+    server = MockCDN((args.host, args.port), args.size, args.video_size, args.latency, args.bandwidth,
+                     args.throttle_rate, args.drop_rate, args.retry_after, args.seed, args.verbose)
+    print("Mock CDN serving on " + server.url + " (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print("\n" + ", ".join("%s=%i" % item for item in sorted(server.stats.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import contextlib
+import cProfile
+import pstats
+import sys
+import threading
+import tracemalloc
+
+from src import printcolors as pc
+
+# From Python 3.12 cProfile hooks into sys.monitoring, which reports the calls of
+# every thread to the one profiler; before that it only sees the thread enabling it
+SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+# Profilers of the pool workers, by thread, while a command is profiled on Python < 3.12
+worker_profilers = None
+lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profile_command(base_name, cpu=False, memory=False, top=25):
+    """
+    Runs the body under cProfile and/or tracemalloc. cProfile stats are dumped
+    to <base_name>.prof (open them with pstats or snakeviz), the top allocation
+    sites to <base_name>_memory.txt.
+
+    Both are process wide, so work done meanwhile by background jobs shows up too.
+    """
+    global worker_profilers
+    profiler = None
+    if cpu:
+        profiler = cProfile.Profile()
+        if not SEES_ALL_THREADS:
+            worker_profilers = {}
+    tracing = memory and not tracemalloc.is_tracing()
+    sampler = None
+    if tracing:
+        tracemalloc.start(10)
+        sampler = PeakSampler()
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        # Tracing stops before the profile stats are built, so they don't show up in the report
+        if tracing:
+            sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            write_memory_report(snapshot, current, peak, sampler, base_name + "_memory.txt", top)
+            pc.printout("\nPeak memory %.1f MB, allocation report saved in %s_memory.txt\n"
+                        % (peak / 1024 / 1024, base_name), pc.CYAN)
+        if profiler is not None:
+            stats = pstats.Stats(profiler)
+            with lock:
+                for worker in (worker_profilers or {}).values():
+                    stats.add(worker)
+                worker_profilers = None
+            stats.dump_stats(base_name + ".prof")
+            pc.printout("\nProfile saved in " + base_name + ".prof\n", pc.CYAN)
+            stats.sort_stats("cumulative").print_stats(10)
+
+
+def propagate(fn):
+    """
+    Wraps fn, about to run on a pool worker, so that a command profiled on
+    Python < 3.12 covers the work of its workers too. Each worker thread keeps
+    one profiler, merged into the command stats at the end.
+    """
+    profilers = worker_profilers
+    if profilers is None:
+        return fn
+
+    def run_profiled(*args, **kwargs):
+        with lock:
+            profiler = profilers.setdefault(threading.get_ident(), cProfile.Profile())
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+    return run_profiled
+
+
+class PeakSampler:
+    """
+    Polls tracemalloc from a daemon thread and keeps a snapshot taken close to
+    the peak: a new one is taken every time the traced memory grows past the
+    last snapshot by more than growth.
+    """
+
+    def __init__(self, interval=0.05, growth=1.1):
+        self.interval = interval
+        self.growth = growth
+        self.size = 0
+        self.snapshot = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run__, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __run__(self):
+        while not self.stopped.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.size * self.growth:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.size = current
+
+
+def filter_snapshot(snapshot):
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+
+def write_sites(f, snapshot, top):
+    for i, stat in enumerate(snapshot.statistics("lineno")[:top], 1):
+        frame = stat.traceback[0]
+        f.write("#%i %s:%i  %.1f KiB in %i blocks\n" % (i, frame.filename, frame.lineno, stat.size / 1024,
+                                                      stat.count))
+
+
+def write_memory_report(snapshot, current, peak, sampler, file_name, top):
+    snapshot = filter_snapshot(snapshot)
+    with open(file_name, "w") as f:
+        f.write("Peak traced memory: %.1f KiB\n" % (peak / 1024))
+        f.write("Still allocated at the end: %.1f KiB\n\n" % (current / 1024))
+        if sampler.snapshot is not None:
+            # Memory freed before the end of the command only shows up here
+            f.write("Top %i allocation sites near the peak (sampled at %.1f KiB):\n" % (top, sampler.size / 1024))
+            write_sites(f, filter_snapshot(sampler.snapshot), top)
+            f.write("\n")
+        f.write("Top %i allocation sites still alive at the end:\n" % top)
+        write_sites(f, snapshot, top)
+        f.write("\nTop %i call stacks:\n" % min(top, 5))
+        for stat in snapshot.statistics("traceback")[:min(top, 5)]:
+            f.write("\n%.1f KiB in %i blocks\n" % (stat.size / 1024, stat.count))
+            f.write("\n".join(stat.traceback.format()) + "\n")
@@ -0,0 +1,79 @@
+import importlib
+
+# Inputs a command can declare; Osintgram.load_inputs fetches each of them once
+# per target and shares it between commands
+INPUTS = ('feed', 'comments', 'stories', 'profile')
+
+commands = {}
+
+
+class Command:
+    def __init__(self, name, help, run, needs=(), analyzer=None):
+        for need in needs:
+            if need not in INPUTS:
+                raise ValueError("unknown input '" + need + "' for command " + name)
+        self.name = name
+        self.help = help
+        self.run = run
+        self.needs = tuple(needs)
+        # The Analyzer subclass behind the command, if any
+        self.analyzer = analyzer
+
+
+def register(name, help, needs=()):
+    """
+    Registers run(osintgram, inputs) as shell command name. inputs holds the
+    data listed in needs, already fetched.
+    """
+    def decorator(run):
+        commands[name] = Command(name, help, run, needs)
+        return run
+    return decorator
+
+
+def register_analyzer(cls):
+    """
+    Class decorator for src.analyzers.Analyzer subclasses, registered under
+    their name, help and needs attributes.
+    """
+    register(cls.name, cls.help, cls.needs)(lambda osintgram, inputs: cls(osintgram).run(inputs))
+    commands[cls.name].analyzer = cls
+    return cls
+
+
+def analyzers(base):
+    # Registered analyzer classes deriving from base, in registration order
+    return [command.analyzer for command in commands.values()
+            if command.analyzer is not None and issubclass(command.analyzer, base)]
+
+
+def register_method(name, method, help, needs=()):
+    """
+    Registers Osintgram.<method> as shell command name. The inputs listed in
+    needs are passed to it as keyword arguments.
+    """
+    register(name, help, needs)(lambda osintgram, inputs: getattr(osintgram, method)(**inputs))
+
+
+def load_plugins(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+register_method('cache', 'clear_cache', "Clear cache of the tool")
+register_method('commentdata', 'get_comment_data', "Get a list of all the comments on the target's posts",
+                ('feed', 'comments'))
+register_method('followers', 'get_followers', "Get target followers")
+register_method('followings', 'get_followings', "Get users followed by target")
+register_method('fwersemail', 'get_fwersemail', "Get email of target followers")
+register_method('fwingsemail', 'get_fwingsemail', "Get email of users followed by target")
+register_method('fwersnumber', 'get_fwersnumber', "Get phone number of target followers")
+register_method('fwingsnumber', 'get_fwingsnumber', "Get phone number of users followed by target")
+register_method('info', 'get_user_info', "Get target info", ('profile',))
+register_method('photos', 'get_user_photo', "Download target's photos in output folder")
+register_method('propic', 'get_user_propic', "Download target's profile picture", ('profile',))
+register_method('stories', 'get_user_stories', "Download target's stories", ('stories',))
+register_method('target', 'change_target', "Set new target (or 'target <username>')")
+register_method('wcommented', 'get_people_who_commented', "Get a list of user who commented target's photos",
+                ('feed', 'comments'))
+register_method('wtagged', 'get_people_who_tagged', "Get a list of user who tagged target")
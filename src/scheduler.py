@@ -0,0 +1,132 @@
+import email.utils
+import random
+import threading
+import time
+
+from instagrapi.exceptions import ClientThrottledError, PleaseWaitFewMinutes
+
+from src import jobs
+from src import printcolors as pc
+
+
+def parse_retry_after(headers):
+    # Retry-After holds either a number of seconds or an HTTP date
+    value = (headers or {}).get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows bursts of up to capacity calls and
+    refills at rate tokens per second.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.not_before = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if now >= self.not_before and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.not_before - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Hold every caller back, e.g. after the server asked us to slow down
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class RequestScheduler:
+    """
+    Wraps the instagrapi client so that every request goes through a shared
+    token bucket and throttling errors are retried with exponential backoff
+    and jitter, honoring the server Retry-After hint when there is one.
+
+    Retried are 429 responses and Instagram's "Please wait a few minutes" 400,
+    at most max_retries times and never waiting longer than backoff_max. Other
+    client errors fail at once so they don't spend the rate budget.
+    """
+
+    # Client helpers that never hit the network
+    local_calls = {'generate_uuid', 'generate_uuid_v4', 'dump_settings', 'get_settings', 'set_settings'}
+
+    def __init__(self, api, rate, capacity, max_retries, backoff_base, backoff_max, metrics=None):
+        self.api = api
+        self.metrics = metrics
+        self.bucket = TokenBucket(rate, capacity)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if name in self.local_calls or name.startswith('_') or not callable(attr):
+            return attr
+
+        def scheduled_call(*args, **kwargs):
+            return self.call(attr, *args, **kwargs)
+
+        return scheduled_call
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            # Background jobs stop at their next request once cancelled
+            jobs.check_cancelled()
+            started = time.perf_counter()
+            self.bucket.acquire()
+            if self.metrics is not None:
+                self.metrics.event('rate_limit_wait_seconds', time.perf_counter() - started)
+            try:
+                return fn(*args, **kwargs)
+            except (ClientThrottledError, PleaseWaitFewMinutes) as e:
+                if self.metrics is not None:
+                    self.metrics.event('throttled')
+                if attempt >= self.max_retries or not self.retryable(e):
+                    raise
+                delay = self.retry_after(e)
+                if delay is not None and delay > self.backoff_max:
+                    # Asked to come back later than we are willing to wait
+                    raise
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                    delay = random.uniform(delay / 2, delay)
+                attempt += 1
+                if self.metrics is not None:
+                    self.metrics.event('retries')
+                pc.printout("\nInstagram is throttling requests, retrying in %.1f seconds (%i/%i)\n"
+                            % (delay, attempt, self.max_retries), pc.YELLOW)
+                self.bucket.pause(delay)
+
+    @staticmethod
+    def retryable(error):
+        if isinstance(error, PleaseWaitFewMinutes):
+            return True
+        code = getattr(error, 'code', None)
+        return code is None or code == 429
+
+    @staticmethod
+    def retry_after(error):
+        response = getattr(error, 'response', None)
+        return parse_retry_after(getattr(response, 'headers', None))
@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src import jobs
+from src import profiling
+
+
+class SharedClient:
+    """
+    Makes one logged-in instagrapi client usable from several threads.
+
+    instagrapi keeps per-request state on the client (last_json, headers), so a
+    client can't serve two requests at once. The thread that logged in uses the
+    client itself; any other thread gets its own copy built from the session
+    settings. Copies share the cookie jar and the connection pool of the
+    original, so they reuse its keep-alive connections and stay logged in.
+
+    Calls that read or change the session settings are serialized and always run
+    on the original client; once the settings change, copies are rebuilt.
+
+    Clients declaring thread_safe (e.g. src.cassette.ReplayClient) are shared as is.
+
+    submit() and map() run calls on a bounded pool of workers.
+    """
+
+    # Calls reading or changing the cookies / settings of the session
+    settings_calls = {'login', 'relogin', 'logout', 'set_settings', 'get_settings', 'load_settings', 'dump_settings',
+                      'set_uuids', 'set_device', 'set_user_agent', 'set_proxy', 'set_locale', 'set_country',
+                      'set_country_code', 'set_timezone_offset'}
+
+    def __init__(self, api, workers=4):
+        self.api = api
+        self.owner = threading.get_ident()
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.generation = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+        if name in self.settings_calls:
+            def settings_call(*args, **kwargs):
+                with self.lock:
+                    result = attr(*args, **kwargs)
+                    if not name.startswith('get_') and name != 'dump_settings':
+                        self.generation += 1
+                return result
+            return settings_call
+
+        def shared_call(*args, **kwargs):
+            return getattr(self.client(), name)(*args, **kwargs)
+
+        return shared_call
+
+    def client(self):
+        # The client serving the calling thread
+        if threading.get_ident() == self.owner or getattr(self.api, 'thread_safe', False):
+            return self.api
+        if getattr(self.local, 'generation', None) != self.generation:
+            with self.lock:
+                client = self.api.__class__(settings=self.api.get_settings())
+                client.private.cookies = self.api.private.cookies
+                client.private.adapters = self.api.private.adapters
+                self.local.client = client
+                self.local.generation = self.generation
+        return self.local.client
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(profiling.propagate(jobs.propagate(fn)), *args, **kwargs)
+
+    def map(self, fn, items):
+        # Yields fn(item) in item order while up to workers items are in flight
+        return self.executor.map(profiling.propagate(jobs.propagate(fn)), items)
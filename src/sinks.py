@@ -0,0 +1,62 @@
+import json
+import sys
+
+
+class TableSink:
+    """
+    Streams rows of a fixed-width table to stdout and optionally to a text file,
+    so long listings never have to be held in memory.
+    """
+
+    def __init__(self, field_names, widths, file_name=None):
+        self.widths = widths
+        self.file = open(file_name, "w") if file_name else None
+        self.border = "+" + "+".join("-" * (w + 2) for w in widths) + "+\n"
+        self.__write__(self.border + self.__row__(field_names) + self.border)
+
+    def __row__(self, values):
+        return "|" + "|".join(" " + str(v).ljust(w) + " " for v, w in zip(values, self.widths)) + "|\n"
+
+    def __write__(self, text):
+        sys.stdout.write(text)
+        if self.file is not None:
+            self.file.write(text)
+
+    def add_row(self, values):
+        self.__write__(self.__row__(values))
+
+    def flush(self):
+        sys.stdout.flush()
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        self.__write__(self.border)
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+
+class JsonSink:
+    """
+    Writes {"<key>": [...]} one item at a time. The file is valid JSON once closed
+    and holds every item written so far even if the run stops halfway.
+    """
+
+    def __init__(self, file_name, key):
+        self.file = open(file_name, "w")
+        self.file.write("{" + json.dumps(key) + ": [")
+        self.count = 0
+
+    def add(self, item):
+        if self.count > 0:
+            self.file.write(", ")
+        self.file.write(json.dumps(item))
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.write("]}")
+        self.file.close()